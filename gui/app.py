@@ -43,7 +43,7 @@ import codetests
 import report
 import statespace
 import utils
-import controlseq
+import sequenceview
 import simrun
 import extensions
 
@@ -196,14 +196,15 @@ class App:
             return
         if sequence.name is None:
             sequence.name = "Sequence"
-        if controlseq.sequence_dialog(sequence, self.window):
+        if sequenceview.sequence_dialog(sequence, self.window):
             self.project.add_sequence(sequence)
         self.edit_control_sequences()
 
     def export_tracelog_sequence(self):
         tab = self.window.get_current_tab()
         sequence = tab.widget.export_sequence()
-        self.save_sequence_into_project(sequence)
+        if sequence is not None:
+            self.save_sequence_into_project(sequence)
 
     def run_file_dialog(self, title, mode, filter_name=None, pattern=None):
         if mode == "open":
@@ -360,7 +361,7 @@ class App:
     def edit_control_sequences(self):
         if self.window.switch_to_tab_by_key("sequences"):
             return
-        widget = controlseq.SequenceListWidget(self.project)
+        widget = sequenceview.SequenceListWidget(self.project)
         self.window.add_tab(Tab(
             "Sequences", widget, "sequences",
             mainmenu_groups=("project",), call_close=True))
@@ -549,6 +550,63 @@ class App:
     def show_info_dialog(self, text):
         self.show_message_dialog(text, gtk.MESSAGE_INFO)
 
+    def run_job(self, title, function, *args):
+        """ Run function(job, *args) in a background thread (see
+            process.Job) and show its progress in a dialog that allows to
+            cancel it. The GUI is not blocked while the job is running.
+            It returns the result of the function or None if the job was
+            cancelled; an exception raised by the function is raised again.
+            The job can be cancelled only after it reports its progress,
+            because it checks the cancellation only there.
+        """
+        job = process.Job(function, *args)
+        dialog = gtk.Dialog(title,
+                            self.window,
+                            gtk.DIALOG_MODAL,
+                            (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL))
+        dialog.set_size_request(400, -1)
+        dialog.set_response_sensitive(gtk.RESPONSE_CANCEL, False)
+        bar = gtk.ProgressBar()
+        dialog.vbox.pack_start(bar, False, False, 10)
+        dialog.show_all()
+
+        outcome = {}
+        cancellable = [ False ]
+        def set_cancellable(value):
+            cancellable[0] = value
+            dialog.set_response_sensitive(gtk.RESPONSE_CANCEL, value)
+
+        def on_progress(done, total, eta):
+            set_cancellable(not job.is_cancelled())
+            if total:
+                bar.set_fraction(min(1.0, float(done) / total))
+            text = "{0}/{1}".format(done, total)
+            if eta is not None:
+                text += " (remaining {0} s)".format(int(eta))
+            bar.set_text(text)
+
+        def on_end(name, value=None):
+            outcome[name] = value
+            dialog.response(gtk.RESPONSE_OK)
+
+        job.set_callback("progress", on_progress)
+        job.set_callback("finished", lambda result: on_end("result", result))
+        job.set_callback("failed", lambda e: on_end("error", e))
+        job.set_callback("cancelled", lambda: on_end("cancelled"))
+        job.start()
+        try:
+            while not outcome:
+                if dialog.run() != gtk.RESPONSE_OK and cancellable[0]:
+                    job.cancel()
+                    set_cancellable(False)
+                    bar.set_text("Cancelling ...")
+        finally:
+            dialog.destroy()
+
+        if "error" in outcome:
+            raise job.exc_info[0], job.exc_info[1], job.exc_info[2]
+        return outcome.get("result")
+
     def console_write(self, text, tag_name = "normal"):
         self.window.console.write(text, tag_name)
 
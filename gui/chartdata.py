@@ -0,0 +1,320 @@
+#
+#    Copyright (C) 2014 Martin Surkovsky
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Preprocessing of (large) data for charts. Charts ask only for the data
+# visible in the current view at the resolution of the screen.
+
+import numpy as np
+
+# Number of bins of the finest level of occupancy (it has to be a power of 2)
+LOD_BINS = 16384
+
+# Intervals are drawn in full resolution if there is at most this number
+# of them in the view
+LOD_MAX_INTERVALS = 2000
+
+
+class IntervalLevels(object):
+    """ Intervals of one row of a Gantt chart aggregated into occupancy bins
+        at several levels of detail. The level 0 has LOD_BINS bins covering
+        <0, end>, every next level has a half of bins of the previous one.
+        A value of a bin is the number of intervals intersecting the bin
+        (an interval spanning more bins is counted in each of them). Levels
+        are computed when they are needed for the first time, so rows with
+        at most LOD_MAX_INTERVALS intervals keep only the intervals. """
+
+    def __init__(self, starts, durations, end=None, bins=LOD_BINS):
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = starts + np.asarray(durations, dtype=np.float64)
+        order = np.argsort(starts, kind="mergesort")
+        self.starts = starts[order]
+        self.ends = ends[order]
+
+        self.sorted_ends = np.sort(self.ends)
+        # The longest interval limits the search of intervals in a view
+        self.max_duration = (self.ends - self.starts).max() \
+                            if len(self.starts) else 0.0
+
+        if end is None:
+            end = self.ends.max() if len(self.ends) else 0.0
+        self.end = max(float(end), 1.0)
+        self.bins = bins
+        self._levels = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def levels(self):
+        if self._levels is None:
+            self._levels = []
+            edges = np.linspace(0.0, self.end, self.bins + 1)
+            level = self._occupancy(edges)
+            while True:
+                self._levels.append(level)
+                if len(level) == 1:
+                    break
+                level = level.reshape(-1, 2).sum(axis=1)
+        return self._levels
+
+    @property
+    def levels_count(self):
+        return self.bins.bit_length()
+
+    def get_bin_width(self, level):
+        return self.end / (self.bins >> level)
+
+    def get_intervals(self, xmin, xmax):
+        """ Return (starts, durations) of intervals intersecting
+            <xmin, xmax>. """
+        first = np.searchsorted(self.starts, xmin - self.max_duration, "left")
+        last = np.searchsorted(self.starts, xmax, "right")
+        starts, ends = self.starts[first:last], self.ends[first:last]
+        visible = ends >= xmin
+        return starts[visible], ends[visible] - starts[visible]
+
+    def query(self, xmin, xmax, pixels):
+        """ Return (starts, durations) of bars that should be drawn to show
+            <xmin, xmax> on a given number of pixels. When there are only
+            few intervals in the view (or pixels is None), they are returned
+            as they are; otherwise occupied bins of a level with a bin width
+            at most one pixel are merged into bars. """
+        if pixels is None:
+            return self.get_intervals(xmin, xmax)
+        xmin, xmax = max(float(xmin), 0.0), min(float(xmax), self.end)
+        if xmax <= xmin or len(self.starts) == 0:
+            return np.zeros(0), np.zeros(0)
+
+        first = np.searchsorted(self.starts, xmin - self.max_duration, "left")
+        last = np.searchsorted(self.starts, xmax, "right")
+        if last - first <= LOD_MAX_INTERVALS:
+            return self.get_intervals(xmin, xmax)
+
+        pixel_width = (xmax - xmin) / max(int(pixels), 1)
+        level = self.select_level(pixel_width)
+        if level is None:
+            # The view is smaller than bins of the finest level
+            edges = np.linspace(xmin, xmax, max(int(pixels), 1) + 1)
+            occupancy = self._occupancy(edges)
+        else:
+            width = self.get_bin_width(level)
+            i = int(xmin / width)
+            j = min(int(np.ceil(xmax / width)), len(self.levels[level]))
+            occupancy = self.levels[level][i:j]
+            edges = np.arange(i, j + 1) * width
+        return _occupied_runs(edges, occupancy)
+
+    def select_level(self, pixel_width):
+        """ Return the coarsest level with bins not wider than a pixel or
+            None if no level is fine enough. """
+        if self.get_bin_width(0) > pixel_width:
+            return None
+        level = int(np.log2(pixel_width / self.get_bin_width(0)))
+        return min(level, self.levels_count - 1)
+
+    def _occupancy(self, edges):
+        """ Return numbers of intervals intersecting bins given by edges;
+            the last bin is closed. """
+        started = np.searchsorted(self.starts, edges[1:], "left")
+        started[-1] = np.searchsorted(self.starts, edges[-1], "right")
+        ended = np.searchsorted(self.sorted_ends, edges[:-1], "left")
+        return np.maximum(started - ended, 0).astype(np.int32)
+
+
+def _occupied_runs(edges, occupancy):
+    """ Merge neighbouring occupied bins into (starts, durations). """
+    occupied = np.concatenate(([False], occupancy > 0, [False]))
+    changes = np.flatnonzero(occupied[1:] != occupied[:-1])
+    begins, ends = changes[0::2], changes[1::2]
+    return edges[begins], edges[ends] - edges[begins]
+
+def split_intervals(data):
+    """ Return (starts, durations) from a structured array with two columns
+        (e.g. 'Time' and 'Duration') or from a sequence of couples. """
+    dtype = getattr(data, "dtype", None)
+    if dtype is not None and dtype.names:
+        start, duration = dtype.names[:2]
+        return (np.ma.filled(data[start], 0).astype(np.float64),
+                np.ma.filled(data[duration], 0).astype(np.float64))
+    data = np.asarray(list(data), dtype=np.float64).reshape(-1, 2)
+    return data[:, 0], data[:, 1]
+
+def decimate_steps(xs, ys, xmin, xmax, pixels):
+    """ Reduce points of a line drawn with 'steps-post' to points visible
+        in <xmin, xmax>. If there are more points than the given number of
+        pixels can show, only the first, the last, the minimal and the
+        maximal point of each pixel column are kept (M4 aggregation), so
+        peaks and steps look the same as with all points. The last point
+        before and the first point after the view are always kept. If
+        pixels is None, all points in the view are returned.
+
+        Arguments:
+        xs -- sorted x-values
+        ys -- y-values
+        """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    first = max(np.searchsorted(xs, xmin, "right") - 1, 0)
+    last = min(np.searchsorted(xs, xmax, "left") + 1, len(xs))
+    xs, ys = xs[first:last], ys[first:last]
+    if pixels is None or xmax <= xmin or len(xs) <= 4 * pixels:
+        return xs, ys
+
+    width = (xmax - xmin) / float(pixels)
+    columns = np.floor((xs - xmin) / width).astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+    ends = np.concatenate((starts[1:], [len(xs)]))
+    groups = np.repeat(np.arange(len(starts)), ends - starts)
+
+    keep = np.zeros(len(xs), dtype=bool)
+    keep[starts] = True
+    keep[ends - 1] = True
+    mins = np.minimum.reduceat(ys, starts)[groups]
+    keep[_first_in_groups(np.flatnonzero(ys == mins), groups)] = True
+    maxs = np.maximum.reduceat(ys, starts)[groups]
+    keep[_first_in_groups(np.flatnonzero(ys == maxs), groups)] = True
+    return xs[keep], ys[keep]
+
+def _first_in_groups(indexes, groups):
+    groups = groups[indexes]
+    return indexes[np.concatenate(([True], groups[1:] != groups[:-1]))]
+
+
+# Number of bins of histograms
+HISTOGRAM_BINS = 10
+
+# Percentiles of durations shown with histograms
+PERCENTILES = [ 50, 90 ]
+
+
+class DurationHistograms(object):
+    """ Durations of transitions binned by shared edges at once for each
+        couple (transition, process). Histograms of any transition, process
+        or both are sums of these counts, so charts do not bin data by
+        themselves. """
+
+    def __init__(self,
+                 durations,
+                 transitions,
+                 processes,
+                 transition_ids=None,
+                 process_ids=None,
+                 bins=HISTOGRAM_BINS):
+        """ Arguments:
+        durations -- an array of durations
+        transitions -- a list of ids of transitions
+        processes -- a list of processes
+        transition_ids -- an array with an id of transition for each duration,
+        if it is None, all durations belong to the first transition
+        process_ids -- the same for processes
+        """
+        self.transitions = list(transitions)
+        self.processes = list(processes)
+        durations = np.ma.filled(durations, 0).astype(np.float64)
+        t_index, t_valid = _encode(transition_ids, self.transitions,
+                                   len(durations))
+        p_index, p_valid = _encode(process_ids, self.processes, len(durations))
+        valid = t_valid & p_valid
+        durations = durations[valid]
+        groups = t_index[valid] * len(self.processes) + p_index[valid]
+        groups_count = len(self.transitions) * len(self.processes)
+
+        if len(durations):
+            low, high = durations.min(), durations.max()
+        else:
+            low, high = 0.0, 1.0
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        self.edges = np.linspace(low, high, bins + 1)
+        indexes = np.searchsorted(self.edges, durations, "right") - 1
+        indexes = np.minimum(indexes, bins - 1) # the last bin is closed
+        self.counts = np.bincount(groups * bins + indexes,
+                                  minlength=groups_count * bins) \
+                        .reshape(len(self.transitions), len(self.processes),
+                                 bins)
+
+        # durations sorted by groups for percentiles
+        order = np.lexsort((durations, groups))
+        self.durations = durations[order]
+        self.bounds = np.searchsorted(groups[order], np.arange(groups_count + 1))
+        self.percentiles = {}
+
+    def get_counts(self, transition=None, process=None):
+        """ Return counts of the transition on the process; None means
+            all transitions (processes). """
+        return self.counts[self._slices(transition, process)] \
+                   .reshape(-1, len(self.edges) - 1).sum(axis=0)
+
+    def get_percentiles(self, transition=None, process=None):
+        """ Return values of PERCENTILES or None if there are no durations;
+            arguments are the same as in get_counts. """
+        key = (transition, process)
+        if key not in self.percentiles:
+            t_slice, p_slice = self._slices(transition, process)
+            durations = [ self.durations[self.bounds[g]:self.bounds[g + 1]]
+                          for g in self._groups(t_slice, p_slice) ]
+            durations = np.concatenate(durations) if durations else []
+            if len(durations):
+                self.percentiles[key] = np.percentile(durations, PERCENTILES)
+            else:
+                self.percentiles[key] = None
+        return self.percentiles[key]
+
+    def _slices(self, transition, process):
+        if transition is None:
+            t_slice = slice(None)
+        else:
+            i = self.transitions.index(transition)
+            t_slice = slice(i, i + 1)
+        if process is None:
+            p_slice = slice(None)
+        else:
+            i = self.processes.index(process)
+            p_slice = slice(i, i + 1)
+        return t_slice, p_slice
+
+    def _groups(self, t_slice, p_slice):
+        processes_count = len(self.processes)
+        return [ t * processes_count + p
+                 for t in range(len(self.transitions))[t_slice]
+                 for p in range(processes_count)[p_slice] ]
+
+def _encode(values, keys, size):
+    """ Return indexes of values in keys and a mask of values found in
+        keys. If values are None, all of them are the first key. """
+    if values is None:
+        return np.zeros(size, dtype=np.int64), np.repeat(bool(keys), size)
+    values = np.ma.filled(values, -1)
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return np.zeros(size, dtype=np.int64), np.zeros(size, dtype=bool)
+    order = np.argsort(keys, kind="mergesort")
+    positions = np.searchsorted(keys[order], values)
+    positions = np.minimum(positions, len(keys) - 1)
+    return order[positions], keys[order][positions] == values
+
+def histogram_counts(values, bins=HISTOGRAM_BINS):
+    """ Bin more arrays of values by shared edges. Returns (edges, a list
+        of counts). """
+    histograms = DurationHistograms(
+        np.concatenate([ np.ma.filled(v, 0) for v in values ]),
+        range(len(values)), [ 0 ],
+        np.repeat(np.arange(len(values)), [ len(v) for v in values ]),
+        None, bins)
+    return histograms.edges, [ histograms.get_counts(i)
+                               for i in range(len(values)) ]
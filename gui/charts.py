@@ -22,6 +22,8 @@ import gtk
 import os
 import paths
 import utils
+import chartdata
+import numpy as np
 import events as evt
 import matplotlib.cm as cm
 from matplotlib.axes        import Axes as mpl_Axes
@@ -75,9 +77,10 @@ class LineConfig:
 
     def copy_mpl_line1(self):
         # TODO: make more general. Not allways is first line of this type!
+        # The line1 can show only a part of values (see place_chart).
         l = mpl_Line(
-            self.x_values, self.y_values, marker='o',
-            drawstyle='steps-post', color=self.color)
+            self.mpl_line1.get_xdata(), self.mpl_line1.get_ydata(),
+            marker='o', drawstyle='steps-post', color=self.color)
         return l
 
     def get_x_values(self):
@@ -206,6 +209,8 @@ class BasicChart(mpl_Axes, evt.EventSource):
         self.ylock = False
         # move with canvas
         self.moving_flag = False
+        # draw all data instead of data reduced for the screen (for saving)
+        self.full_data = False
 
         # redraw properties (backgrounds)
         self.cross_bg = None
@@ -236,6 +241,9 @@ class BasicChart(mpl_Axes, evt.EventSource):
         fig.canvas.mpl_connect("key_release_event", self._switch_ylock_action)
         # register event which stop is drawing cross if it's cursorn over legend
         fig.canvas.mpl_connect("motion_notify_event", self._mouse_over_legend)
+        # charts showing a part of data have to be updated after resizing
+        fig.canvas.mpl_connect(
+            "resize_event", lambda event: self.view_changed())
 
     def __convert_axes_to_data(self, x, y):
         xdisplay, ydisplay = self.transAxes.transform((x,y))
@@ -395,6 +403,7 @@ class BasicChart(mpl_Axes, evt.EventSource):
             xmin, ymin, xmax, ymax = self.zoom_rect
             self.set_xlim(xmin, xmax)
             self.set_ylim(ymin, ymax)
+            self.view_changed()
 
             self.zoom_rect = None
             self.cross_bg = None
@@ -418,6 +427,7 @@ class BasicChart(mpl_Axes, evt.EventSource):
                     ymin is not None and ymax is not None:
                 self.set_xlim(xmin, xmax)
                 self.set_ylim(ymin, ymax)
+                self.view_changed()
                 self.figure.canvas.draw_idle()
 
     def _move_start(self, event):
@@ -451,6 +461,7 @@ class BasicChart(mpl_Axes, evt.EventSource):
             # set new view dimension
             self.set_xlim(data_xmin, data_xmax)
             self.set_ylim(data_ymin, data_ymax)
+            self.view_changed()
             # shift for next step
             self.xypress = (x, y)
             self.figure.canvas.draw_idle()
@@ -490,6 +501,23 @@ class BasicChart(mpl_Axes, evt.EventSource):
             else:
                 self.mouse_on_legend = False
 
+    def view_changed(self):
+        """ It should be called after a change of limits of axes. Charts
+        that draw only visible data recompute them in callbacks of the
+        'view_changed' event. """
+        self.emit_event("view_changed")
+
+    def get_view_pixels(self):
+        """ Returns the width of axes in pixels or None if all data have to
+        be drawn. """
+        if self.full_data:
+            return None
+        return self.bbox.width
+
+    def set_full_data(self, full_data):
+        self.full_data = full_data
+        self.view_changed()
+
     def set_xlock(self, lock):
         self.xlock = lock
         self.emit_event("xlock_changed", lock)
@@ -718,6 +746,7 @@ class ChartWidget(gtk.VBox):
             ax.zoom_stack = []
             ax.set_xlim(xmin, xmax)
             ax.set_ylim(ymin, ymax)
+            ax.view_changed()
             ax.figure.canvas.draw_idle()
 
     def _btn_save_action(self, widget):
@@ -746,7 +775,12 @@ class ChartWidget(gtk.VBox):
 
         response = dialog.run()
         if response == gtk.RESPONSE_OK:
-            self.figure.savefig(dialog.get_filename())
+            ax = self.figure.gca()
+            ax.set_full_data(True)
+            try:
+                self.figure.savefig(dialog.get_filename())
+            finally:
+                ax.set_full_data(False)
 
         dialog.destroy()
 
@@ -804,20 +838,58 @@ def _register_histogram_pick_legend(ax, legend, lines_config):
 
     ax.figure.canvas.mpl_connect('pick_event', on_pick)
 
+def _bars_verts(bars, y, height):
+    starts, durations = bars
+    verts = np.empty((len(starts), 4, 2))
+    verts[:, 0] = verts[:, 1] = starts[:, np.newaxis]
+    verts[:, 2] = verts[:, 3] = (starts + durations)[:, np.newaxis]
+    verts[:, (0, 3), 1] = y
+    verts[:, (1, 2), 1] = y + height
+    return verts
+
 def histogram(names, values, title="", xlabel="", ylabel=""):
 
     if not names or not values:
         return _empty_chart(title, xlabel, ylabel)
 
+    edges, counts = chartdata.histogram_counts(values)
+    return binned_histogram(names, edges, counts, title, xlabel, ylabel)
+
+def binned_histogram(names,
+                     edges,
+                     counts,
+                     title="",
+                     xlabel="",
+                     ylabel="",
+                     percentiles=None):
+    """ Histogram of already binned data.
+
+    Arguments:
+    edges -- edges of bins shared by all data sets
+    counts -- a list of counts, one array for each name
+    percentiles -- a list of values of chartdata.PERCENTILES (or None), one
+    for each name; they are shown in the legend
+    """
+
+    if not names or not counts:
+        return _empty_chart(title, xlabel, ylabel)
+
     figure = mpl_Figure()
     canvas = mpl_FigureCanvas(figure)
     figure.set_canvas(canvas)
 
     ax = figure.add_subplot(111, projection=BasicChart.name)
 
-    colors = [cm.hsv(float(i)/len(values)) for i in xrange(len(values))]
-    n, bins, patches = ax.hist(
-        values, 10, normed=0, histtype="bar", label=names, color=colors)
+    # bars of data sets are side by side in each bin (as in ax.hist)
+    bin_width = edges[1] - edges[0]
+    width = 0.8 * bin_width / len(counts)
+    for i, (name, count) in enumerate(zip(names, counts)):
+        if percentiles is not None and percentiles[i] is not None:
+            name = "{0} ({1})".format(name, ", ".join(
+                "p{0} {1}".format(q, utils.time_to_string(value))
+                for q, value in zip(chartdata.PERCENTILES, percentiles[i])))
+        ax.bar(edges[:-1] + 0.1 * bin_width + i * width, count, width,
+               color=cm.hsv(float(i) / len(counts)), label=name)
 
     for label in ax.xaxis.get_ticklabels():
         label.set_rotation(-35)
@@ -854,19 +926,38 @@ def utilization_chart(names,
     ywidth = 2
     yticks = []
 
+    # Intervals are aggregated into levels of detail, so only bars visible
+    # at the resolution of the screen are drawn (see chartdata).
+    rows = []
     if idles is not None:
         for i, lidle in enumerate(idles):
             y = ((i+1) * ywidth) + (i+1)
-            ax.broken_barh(
-                lidle, (y, ywidth),
-                edgecolor='face', facecolor='#EAA769')
+            rows.append((y, '#EAA769', chartdata.split_intervals(lidle)))
 
     for i, ldata in enumerate(values):
         y = (ywidth+1) * (i+ 1)
         yticks.append(y + ywidth/2)
-        ax.broken_barh(
-            ldata, (y, ywidth),
-            edgecolor='face', facecolor='green')
+        rows.append((y, 'green', chartdata.split_intervals(ldata)))
+
+    ends = [ (starts + durations).max()
+             for y, color, (starts, durations) in rows if len(starts) ]
+    end = max(ends) if ends else 0
+    pixels = figure.get_figwidth() * figure.get_dpi()
+    bars = []
+    for y, color, (starts, durations) in rows:
+        levels = chartdata.IntervalLevels(starts, durations, end)
+        collection = ax.broken_barh(
+            zip(*levels.query(0, end, pixels)), (y, ywidth),
+            edgecolor='face', facecolor=color)
+        bars.append((collection, levels, y))
+
+    def update_bars():
+        xmin, xmax = ax.get_xlim()
+        pixels = ax.get_view_pixels()
+        for collection, levels, y in bars:
+            collection.set_verts(
+                _bars_verts(levels.query(xmin, xmax, pixels), y, ywidth))
+    ax.set_callback("view_changed", update_bars)
 
     ax.set_yticks(yticks)
     ax.set_yticklabels(names)
@@ -915,14 +1006,32 @@ def place_chart(names, values, title="", xlabel="", ylabel=""):
 
     ax = figure.add_subplot(111, projection=BasicChart.name)
 
-    # fill data
+    # fill data; lines show only points distinguishable on the screen,
+    # LineConfig keeps all values
+    pixels = figure.get_figwidth() * figure.get_dpi()
     lines_config = []
     for i, (xvalues, yvalues) in enumerate(values):
+        xvalues, yvalues = np.ma.filled(xvalues, 0), np.ma.filled(yvalues, 0)
+        xmin, xmax = (xvalues[0], xvalues[-1]) if len(xvalues) else (0, 0)
         line, = ax.plot(
-            xvalues, yvalues, 'o-', drawstyle="steps-post", label=names[i])
+            *chartdata.decimate_steps(xvalues, yvalues, xmin, xmax, pixels),
+            marker='o', drawstyle="steps-post", label=names[i])
         lines_config.append(
             LineConfig(line, xvalues, yvalues, line.get_color()))
 
+    def update_lines():
+        xmin, xmax = ax.get_xlim()
+        pixels = ax.get_view_pixels()
+        for line_config in lines_config:
+            xvalues, yvalues = chartdata.decimate_steps(
+                line_config.get_x_values(), line_config.get_y_values(),
+                xmin, xmax, pixels)
+            line_config.get_mpl_line1().set_data(xvalues, yvalues)
+            line2 = line_config.get_mpl_line2()
+            if isinstance(line2, mpl_Line):
+                line2.set_data(xvalues, yvalues)
+    ax.set_callback("view_changed", update_lines)
+
     for label in ax.xaxis.get_ticklabels():
         label.set_rotation(-35)
         label.set_horizontalalignment('left')
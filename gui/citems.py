@@ -467,9 +467,14 @@ class TokenBox(CanvasItem):
         self.size = None
         self.visual_position = None
 
-    def set_tokens(self, tokens, new_tokens, removed_tokens):
-        self.tokens_count = len(tokens) + len(new_tokens)
-        t = utils.collapse_line_repetitions(tokens)
+    def set_tokens(self, tokens, new_tokens, removed_tokens, tokens_count=None):
+        """ 'tokens' may be an iterator, when 'tokens_count' is given only
+            the shown tokens are read from it """
+        if tokens_count is None:
+            tokens = list(tokens)
+            tokens_count = len(tokens)
+        self.tokens_count = tokens_count + len(new_tokens)
+        t = utils.collapse_line_repetitions(tokens, self.max_shown_tokens)
         if len(t) > self.max_shown_tokens:
             self.tokens = map(shorten_token_name, t[:self.max_shown_tokens])
             self.tokens.append("...")
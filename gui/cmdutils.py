@@ -24,6 +24,9 @@ sys.path.append(paths.PTP_DIR)
 import loader
 import os
 import tracelog
+import exportri
+import tablewriter
+import tracestats
 
 def export(filename, directory, trace, lib):
     p = loader.load_project(filename)
@@ -42,10 +45,37 @@ def export(filename, directory, trace, lib):
         build_config.directory = os.path.dirname(filename)
     p.export(build_config)
 
-def check_tracelog(filename):
-    t = tracelog.TraceLog(filename)
+def check_tracelog(filename, filter):
+    t = tracelog.TraceLog(filename, filter=filter)
     print t.get_runinstances_count()
 
+def export_tracelog(filename, output, format, chunk_size, filter):
+    t = tracelog.TraceLog(filename, filter=filter)
+    if format == "csv":
+        writer = lambda columns: tablewriter.CsvTableWriter(
+            output, columns, chunk_size=chunk_size)
+    else:
+        writer = lambda columns: tablewriter.NpyTableWriter(
+            output, columns, chunk_size=chunk_size)
+    print exportri.export_tracelog(t, exportri.default_settings(t.project), writer)
+
+def tracelog_statistics(filename, output, format, filter):
+    t = tracelog.TraceLog(filename, True, filter=filter)
+    stats = tracestats.compute_statistics(t)
+    if format == "csv":
+        tracestats.write_csv(stats, output)
+    else:
+        tracestats.write_json(stats, output)
+
+def tracelog_filter(args):
+    if args.tracelog_start is None and args.tracelog_end is None and \
+            args.tracelog_processes is None and args.tracelog_events is None:
+        return None
+    return tracelog.TraceFilter(args.tracelog_start,
+                                args.tracelog_end,
+                                args.tracelog_processes,
+                                args.tracelog_events)
+
 def main():
     parser = argparse.ArgumentParser(description='Kaira gui command line controller')
     parser.add_argument('--export', metavar='filename', type=str)
@@ -53,12 +83,48 @@ def main():
     parser.add_argument("--trace", action='store_true')
     parser.add_argument('--tracelog', metavar='filename', type=str)
     parser.add_argument("--lib", action='store_true')
+    parser.add_argument('--tracelog-export', metavar='filename', type=str,
+                        help="Export the tracelog (--tracelog) into a file")
+    parser.add_argument('--tracelog-format', choices=["csv", "npy"],
+                        default="csv",
+                        help="'npy' writes a directory with a .npy file "
+                             "per column")
+    parser.add_argument('--chunk-size', metavar='rows', type=int,
+                        default=tablewriter.CHUNK_SIZE)
+    parser.add_argument('--tracelog-stats', metavar='filename', type=str,
+                        help="Write statistics of the tracelog (--tracelog)")
+    parser.add_argument('--stats-format', choices=["json", "csv"],
+                        default="json",
+                        help="'csv' writes a directory with processes.csv, "
+                             "transitions.csv and tokens.csv")
+    parser.add_argument('--tracelog-start', metavar='ns', type=int,
+                        help="Load the tracelog from this time")
+    parser.add_argument('--tracelog-end', metavar='ns', type=int,
+                        help="Load the tracelog up to this time")
+    parser.add_argument('--tracelog-processes', metavar='process', type=int,
+                        nargs="+", help="Load only these processes")
+    parser.add_argument('--tracelog-events', metavar='kinds', type=str,
+                        help="Characters of shown events (e.g. 'TF')")
     args = parser.parse_args()
+    filter = tracelog_filter(args)
     if args.export:
         export(os.path.abspath(args.export), args.output, args.trace, args.lib)
         return
+    if args.tracelog and args.tracelog_export:
+        export_tracelog(args.tracelog,
+                        args.tracelog_export,
+                        args.tracelog_format,
+                        args.chunk_size,
+                        filter)
+        return
+    if args.tracelog and args.tracelog_stats:
+        tracelog_statistics(args.tracelog,
+                            args.tracelog_stats,
+                            args.stats_format,
+                            filter)
+        return
     if args.tracelog:
-        check_tracelog(args.tracelog)
+        check_tracelog(args.tracelog, filter)
 
 if __name__ == "__main__":
     main()
@@ -18,31 +18,12 @@
 #
 
 import re
-import gtk
-import gtkutils
-import objectlist
 import xml.etree.ElementTree as xml
 
 command_parser = re.compile(
    "(?P<process>\d+) (?P<action>[SFTR])( ((?P<arg_int>\d+)|(?P<arg_str>.*)))?"
 )
 
-def sequence_dialog(sequence, mainwindow):
-    builder = gtkutils.load_ui("sequence-dialog")
-    dlg = builder.get_object("sequence-dialog")
-    try:
-        name = builder.get_object("name")
-        name.set_text(sequence.name)
-        name.select_region(0, -1)
-        dlg.set_transient_for(mainwindow)
-        if dlg.run() == gtk.RESPONSE_OK:
-            sequence.name = name.get_text()
-            return True
-        return False
-    finally:
-        dlg.destroy()
-
-
 class ControlSequenceException(Exception):
     pass
 
@@ -130,77 +111,3 @@ class ControlSequence:
         self.commands.append("{0} R {1}".format(process, from_process))
         if self.view:
             self.view.add_receive(process, from_process)
-
-
-class SequenceView(gtkutils.SimpleList):
-
-    def __init__(self, sequence=None):
-        gtkutils.SimpleList.__init__(
-            self, (("P", str), ("Action|markup", str), ("Arg", str)))
-        if sequence:
-            self.load_sequence(sequence)
-
-    def load_sequence(self, sequence):
-        self.clear()
-        sequence.execute(self.add_fire,
-                         self.add_transition_start,
-                         self.add_transition_finish,
-                         self.add_receive)
-
-    def add_fire(self, process_id, transition):
-        self.append((str(process_id),
-                     "<span background='green'>Fire</span>",
-                     transition))
-
-    def add_transition_start(self, process_id, transition):
-        self.append((str(process_id),
-                     "<span background='lightgreen'>StartT</span>",
-                     transition))
-
-    def add_transition_finish(self, process_id):
-        self.append((str(process_id),
-                     "<span background='#FF7070'>FinishT</span>",
-                     ""))
-
-    def add_receive(self, process_id, from_process):
-        self.append((str(process_id),
-                     "<span background='lightblue'>Receive</span>",
-                     str(from_process)))
-
-
-class SequenceListWidget(gtk.HPaned):
-
-    def __init__(self, project):
-        gtk.HPaned.__init__(self)
-        self.project = project
-        buttons = [
-            (None, gtk.STOCK_REMOVE, self._remove_sequence)
-        ]
-
-        self.objlist = objectlist.ObjectList([("_", object), ("Sequences", str) ], buttons)
-        self.objlist.object_as_row = lambda obj: [ obj, obj.name ]
-        self.objlist.cursor_changed = self.on_cursor_changed
-        self.objlist.set_size_request(150, 0)
-        self.event = self.project.set_callback(
-            "sequences_changed",
-            lambda: self.objlist.refresh(project.sequences))
-        self.pack1(self.objlist, False)
-
-        self.view = SequenceView()
-        self.pack2(self.view, True)
-        self.show_all()
-
-        self.objlist.fill(project.sequences)
-
-    def close(self):
-        self.event.remove()
-
-    def on_cursor_changed(self, obj):
-        if obj is None:
-            self.view.clear()
-        else:
-            self.view.load_sequence(obj)
-
-    def _remove_sequence(self, obj):
-        if obj:
-            self.project.remove_sequence(obj)
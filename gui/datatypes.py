@@ -155,7 +155,9 @@ t_tracelog = Type("Kaira tracelog", "Tracelog")
 def load_kth(filename, app, settings=None):
     if filename is None:
         return
-    return (app._catch_io_error(lambda: TraceLog(filename, True)), settings)
+    load = lambda job: TraceLog(filename, True, progress=job.progress)
+    return (app._catch_io_error(lambda: app.run_job("Loading tracelog", load)),
+            settings)
 t_tracelog.register_load_function("kth", load_kth)
 
 def tracelog_view(data, app):
@@ -245,9 +247,8 @@ def load_csv(filename, app, settings):
         table = Table(cols_description, 100)
         row = [None if value == '' else value for value in row]
         table.add_row(row) # add the first loaded row with data
-        for row in csvreader:
-            row = [None if value == '' else value for value in row]
-            table.add_row(row);
+        table.add_rows([None if value == '' else value for value in row]
+                       for row in csvreader)
         table.trim()
         return (table, settings)
 
@@ -18,19 +18,24 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import settingswindow
 from runinstance import RunInstance
 from table import  Table
-from gtk import RESPONSE_APPLY
 
 class ExportRunInstance(RunInstance):
 
     basic_header = ["Event", "Time", "Duration", "Process", "ID"]
 
-    def __init__(self, tracelog, transitions, place_functions, columns):
+    def __init__(self, tracelog, transitions, place_functions, columns,
+                 create_table=None):
+        """ Arguments:
+        create_table -- a function that creates a table-like object (an object
+        with the method 'add_row') from a list of couples (name, data type);
+        by default the rows are collected in Table.
+        """
         RunInstance.__init__(self,
                              tracelog.project,
-                             tracelog.process_count)
+                             tracelog.process_count,
+                             tracelog.get_loaded_processes())
 
         self.transitions = dict((transition.id, transition)
                                 for transition in transitions)
@@ -51,13 +56,18 @@ class ExportRunInstance(RunInstance):
         self.column_value = bool(place_functions)
         self.column_tokens = bool(self.traced_places)
 
-        self.table = self._create_table()
+        if create_table is None:
+            create_table = lambda columns: Table(columns, 100)
+        self.table = self._create_table(create_table)
+
+        # Rows before the start of a filtered tracelog are not exported
+        self.start_time = tracelog.get_start_time()
 
         self.idles = [None] * self.process_count
         self.tokens_counters = [[0] * len(self.traced_places)
                                 for p in range(tracelog.process_count)]
 
-    def _create_table(self):
+    def _create_table(self, create_table):
         header = []
         types = [];
         if self.column_event:
@@ -93,7 +103,7 @@ class ExportRunInstance(RunInstance):
                 header.append(col_name)
                 types.append('<i4')
 
-        return Table(zip(header, types), 100)
+        return create_table(zip(header, types))
 
     def add_row(self, event, time, duration, process, id, (col_name, value)):
         row = []
@@ -118,7 +128,8 @@ class ExportRunInstance(RunInstance):
                 self.tokens_counters[process][couter_index] += value
             row += self.tokens_counters[process]
 
-        self.table.add_row(row)
+        if time >= self.start_time:
+            self.table.add_row(row)
 
     def get_table(self):
         self.table.trim()
@@ -190,7 +201,35 @@ def place_value_name(place, f_index):
 def place_counter_name(place):
     return "C: {0}".format(place.get_name_or_id())
 
+def default_settings(project):
+    """ Return export settings with all traced transitions, functions of
+        traced places and all columns. """
+    place_counters = [place_counter_name(p)
+                      for p in project.nets[0].places()
+                      if p.trace_tokens]
+    return ([ t for t in project.nets[0].transitions() if t.trace_fire ],
+            [ (p, i) for p in project.nets[0].places()
+                     for i, tracing in enumerate(p.trace_tokens_functions)
+                     if tracing.return_numpy_type != 'O' ],
+            ExportRunInstance.basic_header + place_counters)
+
+def export_tracelog(tracelog, settings, writer, progress=None):
+    """ Replay all events of the tracelog and write the exported rows
+        into the writer (a function that creates tablewriter.TableWriter
+        from a list of columns). Rows are written in chunks during the replay,
+        so the table is never kept in memory. It returns the number of
+        written rows. """
+    ri = ExportRunInstance(tracelog, *settings, create_table=writer)
+    try:
+        tracelog.execute_all_events(ri, progress=progress)
+    finally:
+        ri.table.close()
+    return len(ri.table)
+
 def run_assistant(app, tracelog):
+    import settingswindow
+    from gtk import RESPONSE_APPLY
+
     assistant = settingswindow.BasicSettingAssistant(2,
                                                      "Export settings",
                                                      app.window)
@@ -19,7 +19,7 @@
 #
 
 import gtk
-import drawing
+import gtkutils
 import paths
 
 import os
@@ -727,7 +727,7 @@ class OperationShortView(gtk.Alignment, EventSource):
         self.set_padding(5, 0, 5, 5)
         hbox = gtk.HBox(False)
 
-        icon = drawing.StateIcon(self.operation.state)
+        icon = gtkutils.StateIcon(self.operation.state)
         self.event = self.operation.set_callback(
             "state-changed", lambda s: icon.set_state(s))
         hbox.pack_start(icon, False, False)
@@ -785,7 +785,7 @@ class OperationFullView(gtk.VBox, EventSource):
         self.set_border_width(5)
         hbox = gtk.HBox(False)
 
-        icon = drawing.StateIcon(self.operation.state, 25, 25)
+        icon = gtkutils.StateIcon(self.operation.state, 25, 25)
         hbox.pack_start(icon, False, False)
 
         self.events.set_callback(
@@ -23,6 +23,7 @@ import extensions
 import datatypes
 import utils
 import exportri
+import tablewriter
 from exportri import ExportRunInstance
 
 class TracelogExport(extensions.Operation):
@@ -38,10 +39,52 @@ class TracelogExport(extensions.Operation):
         if settings is None:
             return
 
-        ri = ExportRunInstance(tracelog, *settings)
-        tracelog.execute_all_events(ri)
+        def export(job):
+            ri = ExportRunInstance(tracelog, *settings)
+            tracelog.execute_all_events(ri, progress=job.progress)
+            return ri.get_table()
+
+        table = app.run_job("Tracelog export", export)
+        if table is None:
+            return
         return extensions.Source("Tracelog Table",
                                  datatypes.t_table,
-                                 ri.get_table())
+                                 table)
 
 extensions.add_operation(TracelogExport)
+
+
+class TracelogExportToFile(extensions.Operation):
+
+    name = "Tracelog export to file"
+    description = "Export data from tracelog directly into a CSV file or " \
+                  "a directory with .npy file per column"
+
+    parameters = [ extensions.Parameter("Tracelog", datatypes.t_tracelog) ]
+
+    def run(self, app, tracelog):
+
+        settings = exportri.run_assistant(app, tracelog);
+        if settings is None:
+            return
+
+        filename = app.run_file_dialog("Export tracelog", "save")
+        if filename is None:
+            return
+
+        if filename.endswith(".csv"):
+            writer = lambda columns: tablewriter.CsvTableWriter(filename,
+                                                                columns)
+        else:
+            writer = lambda columns: tablewriter.NpyTableWriter(filename,
+                                                                columns)
+        count = app.run_job(
+            "Tracelog export",
+            lambda job: exportri.export_tracelog(
+                tracelog, settings, writer, job.progress))
+        if count is None:
+            return
+        app.console_write("{0} rows exported into '{1}'.\n".format(
+            count, filename), "success")
+
+extensions.add_operation(TracelogExportToFile)
@@ -55,6 +55,51 @@ def netname_dialog(net, mainwindow):
         self.set_fn = set_fn
 
 
+def tracefn_dialog(mainwindow, trace_function):
+    if trace_function is None:
+        mainwindow.app.show_message_dialog(
+            "No tracing function selected.",
+            gtk.MESSAGE_WARNING)
+        return False
+
+    builder = gtkutils.load_ui("tracefn-dialog")
+    dlg = builder.get_object("tracefn-dialog")
+
+    try:
+        name = builder.get_object("name")
+        name.set_text(trace_function.name)
+
+        return_int = builder.get_object("return_int")
+        return_double = builder.get_object("return_double")
+        return_string = builder.get_object("return_string")
+
+        return_type = trace_function.return_type
+        if return_type == "int":
+            return_int.set_active(True)
+        elif return_type == "double":
+            return_double.set_active(True)
+        else:
+            return_string.set_active(True)
+
+        dlg.vbox.show_all()
+
+        dlg.set_title("Trace function")
+        dlg.set_transient_for(mainwindow)
+        if dlg.run() == gtk.RESPONSE_OK:
+            if return_int.get_active():
+                return_type = "int"
+            elif return_double.get_active():
+                return_type = "double"
+            else:
+                return_type = "std::string"
+            trace_function.name = name.get_text()
+            trace_function.return_type = return_type
+            return True
+        return False
+    finally:
+        dlg.destroy()
+
+
 class NetEditor(gtk.VBox):
 
     def __init__(self, app, project):
@@ -399,12 +444,12 @@ class NetEditor(gtk.VBox):
                 refresh()
             def add_fn():
                 trace_fn = tracing.TraceFunction("", "int")
-                result = tracing.tracefn_dialog(self.app.window, trace_fn)
+                result = tracefn_dialog(self.app.window, trace_fn)
                 if result:
                     item.trace_tokens_functions.append(trace_fn)
                     refresh()
             def edit_fn(obj):
-                tracing.tracefn_dialog(self.app.window, obj)
+                tracefn_dialog(self.app.window, obj)
                 refresh()
             def remove_fn(obj):
                 item.trace_tokens_functions.remove(obj)
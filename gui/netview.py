@@ -38,6 +38,12 @@ class NetViewCanvasConfig(cconfig.NetCanvasConfig):
         self.activations = {} # Canvas items for activations by transition.id
         self.packet_boxes = {} # Canvas items for packet by edge.id
 
+        # Items are created again only when the shown state is changed
+        self.net_items = None # (net, view mode, items of the net)
+        self.token_keys = {} # place.id -> Perspective.get_tokens_key
+        self.activation_items = {} # transition.id -> (values, items)
+        self.packet_items = {} # edge.id -> (packets info, items)
+
     def set_perspective(self, perspective):
         self.perspective = perspective
         self.set_net(self.perspective.runinstance.net)
@@ -47,9 +53,13 @@ class NetViewCanvasConfig(cconfig.NetCanvasConfig):
         cconfig.NetCanvasConfig.configure_item(self, item)
 
     def collect_items(self):
-        items = cconfig.NetCanvasConfig.collect_items(self)
-        for item in items:
-            item.action = None
+        key = (self.net, self.get_view_mode())
+        if self.net_items is None or self.net_items[:2] != key:
+            items = cconfig.NetCanvasConfig.collect_items(self)
+            for item in items:
+                item.action = None
+            self.net_items = key + (items,)
+        items = list(self.net_items[2])
         if self.net is not None:
             items += self.get_token_items()
             items += self.get_activation_items()
@@ -68,8 +78,12 @@ class NetViewCanvasConfig(cconfig.NetCanvasConfig):
                 self.activations[transition.id] = activations
             values = self.perspective.get_activations_values(transition)
             if values:
+                cached = self.activation_items.get(transition.id)
+                if cached is None or cached[0] != values:
+                    cached = (values, activations.create_activations(values))
+                    self.activation_items[transition.id] = cached
                 result.append(activations)
-                result += activations.create_activations(values)
+                result += cached[1]
         return result
 
     def get_token_items(self):
@@ -83,9 +97,14 @@ class NetViewCanvasConfig(cconfig.NetCanvasConfig):
                                             (sx + 20, sy / 2))
                 token_box = citems.TokenBox(None, "tokenbox", citems.AbsPlacement(position))
                 self.token_boxes[place.id] = token_box
-            token_box.set_tokens(self.perspective.get_tokens(place),
-                                 self.perspective.get_new_tokens(place),
-                                 self.perspective.get_removed_tokens(place))
+            key = self.perspective.get_tokens_key(place)
+            if self.token_keys.get(place.id) != key:
+                # only shown tokens are formatted
+                token_box.set_tokens(self.perspective.iter_tokens(place),
+                                     self.perspective.get_new_tokens(place),
+                                     self.perspective.get_removed_tokens(place),
+                                     self.perspective.get_tokens_count(place))
+                self.token_keys[place.id] = key
             result.append(token_box)
         return result
 
@@ -118,6 +137,11 @@ class NetViewCanvasConfig(cconfig.NetCanvasConfig):
 
                 self.packet_boxes[edge.id] = packet_box
             result.append(packet_box)
+            cached = self.packet_items.get(edge.id)
+            if cached is not None and cached[0] == packets:
+                result += cached[1]
+                continue
+            items = []
             packet_box.texts = [ p[3] for p in packets ]
             for i, (process_id, origin_id, top, text) in enumerate(packets):
                 position = utils.vector_add(packet_box.get_position(),
@@ -136,7 +160,9 @@ class NetViewCanvasConfig(cconfig.NetCanvasConfig):
                 t.padding_y = 4
                 t.z_level = 15
                 t.action = None
-                result.append(t)
+                items.append(t)
+            self.packet_items[edge.id] = (packets, items)
+            result += items
         return result
 
     def on_item_click(self, item, position):
@@ -18,9 +18,13 @@
 #
 
 import gtk
+import gobject
 import socket
+import sys
+import time
 from subprocess import Popen, PIPE, STDOUT
 from threading import Thread, Lock
+from events import EventSource
 
 
 class ReadLineThread(Thread):
@@ -224,3 +228,86 @@ class CommandWrapper:
             buffer = [ line ] + [ stream.readline() for i in xrange(lines - 1) ]
             cb(buffer)
         return True
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(EventSource):
+    """ A function running in a background thread. The function is called
+        with the job as the first argument; it should report its progress
+        by the method 'progress' that also raises JobCancelled when the job
+        is cancelled.
+
+        Events are emitted in the GTK thread without blocking the job:
+        "progress" (done, total, eta in seconds or None),
+        "finished" (result), "failed" (exception), "cancelled" ()
+        No event is emitted after the job is detached. When the job fails,
+        'exc_info' holds sys.exc_info() of the exception.
+    """
+
+    progress_interval = 0.2 # Minimal time between two "progress" events
+
+    def __init__(self, function, *args):
+        EventSource.__init__(self)
+        self.function = function
+        self.args = args
+        self.lock = Lock()
+        self.cancel_flag = False
+        self.detached = False # Used only in the GTK thread
+        self.start_time = None
+        self.last_progress_time = 0
+        self.thread = None
+        self.exc_info = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.thread = Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        with self.lock:
+            self.cancel_flag = True
+
+    def detach(self):
+        """ Cancel the job and drop its pending events; it is called from
+            the GTK thread when the owner of callbacks is closed. """
+        self.detached = True
+        self.cancel()
+
+    def is_cancelled(self):
+        with self.lock:
+            return self.cancel_flag
+
+    def progress(self, done, total):
+        if self.is_cancelled():
+            raise JobCancelled()
+        now = time.time()
+        if now - self.last_progress_time < self.progress_interval:
+            return
+        self.last_progress_time = now
+        if done > 0 and total:
+            eta = (now - self.start_time) * (total - done) / done
+        else:
+            eta = None
+        self._emit_in_gtk_thread("progress", done, total, eta)
+
+    def _run(self):
+        try:
+            result = self.function(self, *self.args)
+        except JobCancelled:
+            self._emit_in_gtk_thread("cancelled")
+        except Exception, e:
+            self.exc_info = sys.exc_info()
+            self._emit_in_gtk_thread("failed", e)
+        else:
+            self._emit_in_gtk_thread("finished", result)
+
+    def _emit_in_gtk_thread(self, event_name, *params):
+        def emit():
+            if not self.detached:
+                self.emit_event(event_name, *params)
+            return False # do not repeat
+        gobject.idle_add(emit)
@@ -24,7 +24,22 @@ import ptp
 import utils
 
 from events import EventSource
-from simconfig import SimConfig
+
+class SimConfig:
+
+    process_count = 4
+    parameters_values = None
+    sequence = None
+
+    def reset_param_values(self):
+        self.parameters_values = None
+
+    def set_param_values(self, values):
+        self.parameters_values = values
+
+    def set_process_count(self, value):
+        self.process_count = value
+
 
 class Project(EventSource):
     """
@@ -19,9 +19,18 @@
 
 import utils
 from copy import copy
+from collections import OrderedDict, deque
 
+# Estimated memory (in bytes) taken by a net instance, a token and a packet;
+# see RunInstance.estimate_size
+NET_INSTANCE_SIZE = 4096
+TOKEN_SIZE = 512
+PACKET_SIZE = 128
 
-class Packet:
+
+class Packet(object):
+
+    __slots__ = ("time", "size", "edge_id")
 
     def __init__(self, time, size, edge_id):
         self.time = time
@@ -29,11 +38,67 @@ class Packet:
         self.edge_id = edge_id
 
 
+class PacketQueue(object):
+    """ Packets sent from one process to another one. Packets are also
+        grouped by edges with their total size, so information about an
+        edge does not need to go through all packets. """
+
+    __slots__ = ("order", "edges")
+
+    def __init__(self):
+        self.order = deque() # edge ids of packets in the order of sending
+        self.edges = {} # edge_id -> [ deque of packets, size of packets ]
+
+    def __len__(self):
+        return len(self.order)
+
+    def push(self, packet):
+        self.order.append(packet.edge_id)
+        edge = self.edges.get(packet.edge_id)
+        if edge is None:
+            self.edges[packet.edge_id] = [ deque((packet,)), packet.size ]
+        else:
+            edge[0].append(packet)
+            edge[1] += packet.size
+
+    def pop(self):
+        edge_id = self.order.popleft()
+        edge = self.edges[edge_id]
+        packet = edge[0].popleft()
+        if edge[0]:
+            edge[1] -= packet.size
+        else:
+            del self.edges[edge_id]
+        return packet
+
+    def top_edge_id(self):
+        return self.order[0]
+
+    def get_edge_info(self, edge_id):
+        """ Return (the first packet, number of packets, size of packets)
+            of the edge or None """
+        edge = self.edges.get(edge_id)
+        if edge is None:
+            return None
+        return edge[0][0], len(edge[0]), edge[1]
+
+    def copy(self):
+        queue = PacketQueue()
+        queue.order = deque(self.order)
+        queue.edges = dict((edge_id, [ deque(packets), size ])
+                           for edge_id, (packets, size)
+                           in self.edges.iteritems())
+        return queue
+
+
 class RunInstance:
 
-    def __init__(self, project, process_count):
+    def __init__(self, project, process_count, loaded_processes=None):
+        """ 'loaded_processes' -- ids of processes whose events are replayed
+            (see tracelog.TraceFilter); None means all processes """
         self.project = project
         self.process_count = process_count
+        self.loaded_processes = loaded_processes
         self.net = None
         self.net_instances = {}
         self.activites = [None] * self.process_count
@@ -41,7 +106,12 @@ class RunInstance:
         self.last_event_activity = None
         self.last_event_instance = None
         self.last_event_time = None
-        self.packets = [ [] for i in xrange(self.process_count * self.process_count)]
+        self.last_event_process = None
+        # Only queues of communicating processes are allocated
+        self.packets = {} # target_id -> { origin_id -> PacketQueue }
+        # Targets and (target, origin) queues not shared with a copy
+        self.owned_targets = set()
+        self.owned_packets = set()
 
     def add_token(self, place_id, token_pointer, token_value, send_time=None):
         self.last_event_instance.add_token(place_id, token_pointer, token_value, send_time)
@@ -89,7 +159,9 @@ class RunInstance:
         if self.last_event_activity is not None:
             # None can occur when we are logging
             # "quit" but not transition fire
+            self.last_event_activity = copy(self.last_event_activity)
             self.last_event_activity.quit = True
+            self.activites[process_id] = self.last_event_activity
         self.last_event_instance = self.net_instances[process_id]
 
     def event_idle(self, process_id, time):
@@ -101,7 +173,7 @@ class RunInstance:
 
     def event_send(self, process_id, time, target_id, size, edge_id):
         packet = Packet(time, size, edge_id)
-        self.packets[target_id * self.process_count + process_id].append(packet)
+        self._own_packets(target_id, process_id).push(packet)
 
     def event_end(self, process_id, time):
         pass
@@ -110,12 +182,17 @@ class RunInstance:
         self.last_event = "receive"
         self.last_event_process = process_id
         self.last_event_time = time
-        packets = self.packets[process_id * self.process_count + origin_id]
-        packet = packets[0]
-        del packets[0]
         self.last_event_instance = self.net_instances[process_id]
         self.set_activity(process_id,
                           Receive(time, process_id, origin_id))
+        if self.loaded_processes is not None and \
+                origin_id not in self.loaded_processes:
+            # Sends of the origin are not replayed (see tracelog.TraceFilter)
+            return 0
+        packet = self._own_packets(process_id, origin_id).pop()
+        origins = self.packets[process_id]
+        if not origins[origin_id]:
+            del origins[origin_id]
         return time - packet.time
 
     def transition_fired(self, process_id, time, transition_id, values):
@@ -130,7 +207,13 @@ class RunInstance:
             self.activites[process_id] = self.last_event_activity
 
     def transition_blocked(self, process_id):
-        self.activites[process_id].blocked = True
+        # activities are shared by copies of the instance, so they are
+        # replaced instead of changed
+        activity = copy(self.activites[process_id])
+        activity.blocked = True
+        if self.last_event_activity is self.activites[process_id]:
+            self.last_event_activity = activity
+        self.activites[process_id] = activity
 
     def transition_finished(self, process_id, time):
         self.last_event = "finish"
@@ -141,15 +224,64 @@ class RunInstance:
         self.activites[process_id] = None
 
     def copy(self):
+        """ Return an independent copy of the instance; replaying events on
+            the copy does not change the original instance. The copy shares
+            unchanged data with the original instance, so it costs memory
+            only for changes made after the copy. """
         runinstance = RunInstance(self.project,
-                                  self.process_count)
+                                  self.process_count,
+                                  self.loaded_processes)
+        runinstance.net = self.net
         for i in self.net_instances:
             n = self.net_instances[i].copy()
             runinstance.net_instances[i] = n
 
+        # Activities are replaced (not changed) by events, so they can be
+        # shared; packet queues are shared until they are changed
         runinstance.activites = self.activites[:]
+        runinstance.packets = self.packets.copy()
+        self.owned_targets = set()
+        self.owned_packets = set()
+
+        runinstance.last_event = self.last_event
+        runinstance.last_event_activity = self.last_event_activity
+        if self.last_event_instance is not None:
+            runinstance.last_event_instance = \
+                runinstance.net_instances[self.last_event_instance.process_id]
+        runinstance.last_event_time = self.last_event_time
+        runinstance.last_event_process = self.last_event_process
         return runinstance
 
+    def estimate_size(self):
+        """ Return an estimated memory (in bytes) taken by the instance.
+            Copies share unchanged data, so the estimate is an upper bound
+            for a copy. """
+        tokens = sum(instance.tokens.tokens_count()
+                     for instance in self.net_instances.itervalues())
+        packets = sum(len(queue)
+                      for origins in self.packets.itervalues()
+                      for queue in origins.itervalues())
+        return NET_INSTANCE_SIZE * len(self.net_instances) + \
+               TOKEN_SIZE * tokens + PACKET_SIZE * packets
+
+    def _own_packets(self, target_id, origin_id):
+        origins = self.packets.get(target_id)
+        if target_id not in self.owned_targets:
+            origins = dict(origins) if origins else {}
+            self.packets[target_id] = origins
+            self.owned_targets.add(target_id)
+
+        queue = origins.get(origin_id)
+        if queue is None:
+            queue = PacketQueue()
+            origins[origin_id] = queue
+            self.owned_packets.add((target_id, origin_id))
+        elif (target_id, origin_id) not in self.owned_packets:
+            queue = queue.copy()
+            origins[origin_id] = queue
+            self.owned_packets.add((target_id, origin_id))
+        return queue
+
     def get_perspectives(self):
         perspectives = [ Perspective("All", self, self.net_instances) ]
         v = self.net_instances.keys()
@@ -162,19 +294,18 @@ class RunInstance:
 
     def get_packets_info(self, edge_id, process_id):
         results = []
-        for i in xrange(self.process_count):
-            packets = self.packets[process_id * self.process_count + i]
-            ps = [ p for p in packets if p.edge_id == edge_id ]
-            if ps:
-                itr = iter(ps)
-                first = next(itr)
+        origins = self.packets.get(process_id)
+        if not origins:
+            return results
+        for i in sorted(origins):
+            queue = origins[i]
+            info = queue.get_edge_info(edge_id)
+            if info is not None:
+                first, count, size = info
                 text = "{0} -> {1} | {2}".format(i, process_id, first.size)
-                if len(ps) > 1:
-                    size = 0
-                    for p in itr:
-                        size += p.size
-                    text += " ({0}, {1})".format(len(ps) - 1, size)
-                if packets[0].edge_id != edge_id:
+                if count > 1:
+                    text += " ({0}, {1})".format(count - 1, size - first.size)
+                if queue.top_edge_id() != edge_id:
                     top = False
                     text += " *"
                 else:
@@ -183,7 +314,17 @@ class RunInstance:
         return results
 
     def get_packets_count(self, origin_id, target_id):
-        return len(self.packets[target_id * self.process_count + origin_id])
+        origins = self.packets.get(target_id)
+        if not origins or origin_id not in origins:
+            return 0
+        return len(origins[origin_id])
+
+    def get_packet_origins(self, target_id):
+        """ Return sorted ids of processes that sent packets to the target """
+        origins = self.packets.get(target_id)
+        if not origins:
+            return []
+        return sorted(origins)
 
 
 class ProcessActivity:
@@ -213,6 +354,125 @@ class Receive(ProcessActivity):
         self.origin_id = origin_id
 
 
+class TokenStore:
+    """ Tokens (triplets (pointer, value, send time)) of places kept in
+        the order of their insertion. A token is found by its place and
+        pointer in O(1); tokens with the same pointer are removed in the
+        order of their insertion.
+
+        Copies share tokens of places; a place is copied when it is changed
+        for the first time after the copy (copy-on-write). """
+
+    def __init__(self):
+        self.places = {} # place_id -> OrderedDict(key -> token)
+        # place_id -> { token_pointer : key }; keys of more tokens with
+        # the same pointer are kept in a deque
+        self.pointers = {}
+        self.owned = set() # places that are not shared with other store
+        self.next_key = 0
+        # Stamps of the last change of places; an unchanged place has the same
+        # stamp in the store and all its copies
+        self.origin = object()
+        self.changes = 0
+        self.stamps = {}
+
+    def get(self, place_id):
+        """ Return an iterable of tokens in the place or None """
+        tokens = self.places.get(place_id)
+        if tokens is None:
+            return None
+        return tokens.itervalues()
+
+    def count(self, place_id):
+        tokens = self.places.get(place_id)
+        if tokens is None:
+            return 0
+        return len(tokens)
+
+    def tokens_count(self):
+        """ Return the number of tokens in all places """
+        return sum(len(tokens) for tokens in self.places.itervalues())
+
+    def get_stamp(self, place_id):
+        """ Return a value that is changed by each change of the place """
+        return (self.origin, self.stamps.get(place_id, 0))
+
+    def add(self, place_id, token):
+        key = self.next_key
+        self.next_key += 1
+
+        tokens, pointers = self._own(place_id)
+        tokens[key] = token
+        self._touch(place_id)
+        keys = pointers.get(token[0])
+        if keys is None:
+            pointers[token[0]] = key
+        elif isinstance(keys, deque):
+            keys.append(key)
+        else:
+            pointers[token[0]] = deque((keys, key))
+
+    def remove(self, place_id, token_pointer):
+        """ Remove and return the token or None if there is no such token """
+        pointers = self.pointers.get(place_id)
+        if pointers is None or token_pointer not in pointers:
+            return None
+        tokens, pointers = self._own(place_id)
+        keys = pointers[token_pointer]
+        if isinstance(keys, deque):
+            key = keys.popleft()
+            if not keys:
+                del pointers[token_pointer]
+        else:
+            key = keys
+            del pointers[token_pointer]
+        self._touch(place_id)
+        return tokens.pop(key)
+
+    def remove_all(self, place_id):
+        self.owned.discard(place_id)
+        self.pointers.pop(place_id, None)
+        self._touch(place_id)
+        tokens = self.places.pop(place_id, None)
+        if tokens is None:
+            return None
+        return tokens.values()
+
+    def copy(self):
+        store = TokenStore()
+        store.places = self.places.copy()
+        store.pointers = self.pointers.copy()
+        store.next_key = self.next_key
+        store.origin = self.origin
+        store.changes = self.changes
+        store.stamps = self.stamps.copy()
+        # places are now shared by both stores
+        self.owned = set()
+        return store
+
+    def _touch(self, place_id):
+        self.changes += 1
+        self.stamps[place_id] = self.changes
+
+    def _own(self, place_id):
+        if place_id in self.owned:
+            return self.places[place_id], self.pointers[place_id]
+        tokens = self.places.get(place_id)
+        if tokens is None:
+            tokens = OrderedDict()
+            pointers = {}
+        else:
+            tokens = tokens.copy()
+            pointers = dict((token_pointer,
+                             deque(keys) if isinstance(keys, deque) else keys)
+                            for token_pointer, keys
+                            in self.pointers[place_id].iteritems())
+        self.places[place_id] = tokens
+        self.pointers[place_id] = pointers
+        self.owned.add(place_id)
+        return tokens, pointers
+
+
 class NetInstance:
 
     def __init__(self, process_id, tokens=None):
@@ -221,7 +481,7 @@ class NetInstance:
         self.new_tokens = {}
         self.removed_tokens = {}
         if tokens is None:
-            self.tokens = {}
+            self.tokens = TokenStore()
         else:
             self.tokens = tokens
 
@@ -244,36 +504,27 @@ class NetInstance:
             'removed_tokens' tokens are emptied
         """
         if self.new_tokens:
-            for place_id in self.new_tokens:
-                lst = self.tokens.get(place_id)
-                if lst is None:
-                    lst = []
-                    self.tokens[place_id] = lst
-                lst += self.new_tokens.get(place_id)
+            for place_id, lst in self.new_tokens.iteritems():
+                for token in lst:
+                    self.tokens.add(place_id, token)
             self.new_tokens = {}
 
         if self.removed_tokens:
             self.removed_tokens = {}
 
     def remove_token(self, place_id, token_pointer):
-        lst = self.tokens.get(place_id)
-        if lst is None:
+        token = self.tokens.remove(place_id, token_pointer)
+        if token is None:
             return
 
         removed_lst = self.removed_tokens.get(place_id)
         if removed_lst is None:
             removed_lst = []
             self.removed_tokens[place_id] = removed_lst
-
-        for i in xrange(len(lst)):
-            if lst[i][0] == token_pointer:
-                removed_lst.append(lst[i])
-                del lst[i]
-                return
+        removed_lst.append(token)
 
     def remove_all_tokens(self, place_id):
-        self.removed_tokens[place_id] = self.tokens.get(place_id)
-        self.tokens[place_id] = None
+        self.removed_tokens[place_id] = self.tokens.remove_all(place_id)
 
     def add_enabled_transition(self, transition_id):
         if self.enabled_transitions is None:
@@ -281,11 +532,17 @@ class NetInstance:
         self.enabled_transitions.append(transition_id)
 
     def copy(self):
-        netinstance = NetInstance(self.process_id, copy(self.tokens))
+        netinstance = NetInstance(self.process_id, self.tokens.copy())
+        netinstance.new_tokens = copy_tokens(self.new_tokens)
+        netinstance.removed_tokens = copy_tokens(self.removed_tokens)
         netinstance.enabled_transitions = copy(self.enabled_transitions)
         return netinstance
 
 
+def copy_tokens(tokens):
+    return dict((place_id, copy(lst)) for place_id, lst in tokens.items())
+
+
 class Perspective(utils.EqMixin):
 
     ARROW_LEFT  = u"\u21a4 "
@@ -298,15 +555,30 @@ class Perspective(utils.EqMixin):
         self.net_instances = net_instances
 
     def get_tokens(self, place):
-        tokens = []
+        return list(self.iter_tokens(place))
+
+    def iter_tokens(self, place):
+        """ Like get_tokens, but strings are formatted when they are read """
         for net_instance in self.net_instances.values():
             t = net_instance.tokens.get(place.id)
             if t is not None:
                 for token_pointer, token_value, token_time in t:
                     if token_value is None:
                         token_value = Perspective.BULLET
-                    tokens.append("{0}@{1}".format(token_value, net_instance.process_id))
-        return tokens
+                    yield "{0}@{1}".format(token_value, net_instance.process_id)
+
+    def get_tokens_count(self, place):
+        return sum(net_instance.tokens.count(place.id)
+                   for net_instance in self.net_instances.values())
+
+    def get_tokens_key(self, place):
+        """ Return a value that is equal for two perspectives iff they show
+            the same tokens in the place """
+        return [ (net_instance.process_id,
+                  net_instance.tokens.get_stamp(place.id),
+                  net_instance.new_tokens.get(place.id),
+                  net_instance.removed_tokens.get(place.id))
+                 for net_instance in self.net_instances.values() ]
 
     def get_new_tokens(self, place):
         tokens = []
@@ -21,19 +21,23 @@
 
 import gtk
 import charts
+import chartdata
 import utils
 import netview
+import process
 from exportri import place_counter_name
 
 class RunView(gtk.VBox):
 
     def __init__(self, app, tracelog):
         gtk.VBox.__init__(self)
+        self.app = app
         self.tracelog = tracelog
+        self.replay_job = None # A job replaying events in the background
+        self.replay_index = None # An index waiting for the running job
 
         button = gtk.Button("Export sequence")
-        button.connect("clicked", lambda w:
-                app.save_sequence_into_project(self.export_sequence()))
+        button.connect("clicked", lambda w: self._export_sequence_clicked())
 
         self.netinstance_view = netview.NetView(app, None, other_widgets=[button])
         self.netinstance_view.set_config(
@@ -43,22 +47,42 @@ class RunView(gtk.VBox):
         table = tracelog.data
 
         net = tracelog.project.nets[0]
-        processes = range(tracelog.process_count)
+        processes = tracelog.get_processes()
         transitions = [ t for t in net.transitions() if t.trace_fire ]
         places = [ p for p in net.places() if p.trace_tokens ]
 
+        # Charts are built when they are selected for the first time
+        self.histograms = None # TET histograms shared by three charts
+        self.view_builders = [
+            ("Utilization of processes",
+             lambda: process_utilization(table, processes)),
+            ("Utilization of transitions",
+             lambda: transition_utilization(table, processes, transitions)),
+            ("Transition execution times (TETs)",
+             lambda: tet_per_processes_and_transitions_histogram(
+                 table, self._get_histograms(), processes, transitions)),
+            ("TETs (grouped by processes)",
+             lambda: tet_per_processes_histogram(
+                 table, self._get_histograms(), processes)),
+            ("TETs (grouped by transitions)",
+             lambda: tet_per_transitions_histogram(
+                 table, self._get_histograms(), transitions)),
+            ("Number of tokens",
+             lambda: tokens_count(table, processes, places)) ]
+
         self.views = [ ("Replay", self.netinstance_view) ]
-        self.views.append(process_utilization(table, processes))
-        self.views.append(transition_utilization(table, processes, transitions))
-        self.views.append(tet_per_processes_and_transitions_histogram(
-            table, processes, transitions))
-        self.views.append(tet_per_processes_histogram(table, processes))
-        self.views.append(tet_per_transitions_histogram(table, transitions))
-        self.views.append(tokens_count(table, processes, places))
+        self.views += [ (name, None) for name, builder in self.view_builders ]
 
         self.pack_start(self._controlls(), False, False)
-        for name, item in self.views:
-            self.pack_start(item)
+        self.pack_start(self.netinstance_view)
+        self.connect("parent-set", self._parent_set)
+
+    def _parent_set(self, widget, old_parent):
+        if self.get_parent() is None and self.replay_job is not None:
+            # The view was closed; results of the replay are not needed
+            self.replay_job.detach()
+            self.replay_job = None
+            self.replay_index = None
 
     def _controlls(self):
         self.scale = gtk.HScale(gtk.Adjustment(value=0, lower=0,
@@ -93,6 +117,9 @@ class RunView(gtk.VBox):
         self.info_label = gtk.Label()
         toolbar.pack_start(self.info_label, False, False)
 
+        self.replay_label = gtk.Label()
+        toolbar.pack_start(self.replay_label, False, False)
+
         self.update_labels()
         toolbar.show_all()
         return toolbar
@@ -101,25 +128,97 @@ class RunView(gtk.VBox):
         return int(self.scale.get_value())
 
     def show_runinstance(self):
-        index = self.get_event_index()
-        runinstance = self.tracelog.get_event_runinstance(index)
-        self.netinstance_view.set_runinstance(runinstance)
         self.update_labels()
+        if self.replay_job is not None:
+            # The running replay is stopped and the newest index is
+            # replayed when it ends
+            self.replay_index = self.get_event_index()
+            self.replay_job.cancel()
+            return
+        self._start_replay(self.get_event_index())
+
+    def _start_replay(self, index):
+        def replay(job):
+            runinstance = self.tracelog.get_event_runinstance(index,
+                                                              job.progress)
+            # The view gets a copy that is not changed by next replays
+            return runinstance.copy()
+
+        def failed(e):
+            self._replay_finished(None)
+            self.app.show_error_dialog(str(e))
+
+        self.replay_job = process.Job(replay)
+        self.replay_job.set_callback("finished", self._replay_finished)
+        self.replay_job.set_callback("cancelled",
+                                     lambda: self._replay_finished(None))
+        self.replay_job.set_callback("failed", failed)
+        self.replay_job.set_callback("progress", self._replay_progress)
+        self.replay_job.start()
+
+    def _replay_progress(self, done, total, eta):
+        self.replay_label.set_text("Replaying {0}%".format(100 * done / total))
+
+    def _replay_finished(self, runinstance):
+        self.replay_job = None
+        self.replay_label.set_text("")
+        if runinstance is not None:
+            self.netinstance_view.set_runinstance(runinstance)
+        if self.replay_index is not None:
+            index = self.replay_index
+            self.replay_index = None
+            self._start_replay(index)
 
     def export_sequence(self):
-        return self.tracelog.export_sequence(self.get_event_index())
+        """ Return a control sequence up to the shown event or None if
+            the export was cancelled or failed. Events are replayed in
+            the background, so the GUI is not blocked by a running replay
+            that holds the tracelog. """
+        index = self.get_event_index()
+        export = lambda job: self.tracelog.export_sequence(index,
+                                                           job.progress)
+        try:
+            return self.app.run_job("Exporting sequence", export)
+        except Exception, e:
+            self.app.show_error_dialog(str(e))
+            return None
+
+    def _export_sequence_clicked(self):
+        sequence = self.export_sequence()
+        if sequence is not None:
+            self.app.save_sequence_into_project(sequence)
 
     def _view_change(self, w):
         text = w.get_active_text()
-        for name, item in self.views:
+        for i, (name, item) in enumerate(self.views):
             if name == text:
+                if item is None:
+                    item = self._build_view(name)
+                    self.views[i] = (name, item)
+                    self.pack_start(item)
                 item.show_all()
                 if isinstance(item, charts.ChartWidget):
                     # set focus on graph canvas
                     item.get_figure().canvas.grab_focus()
-            else:
+            elif item is not None:
                 item.hide()
 
+    def _build_view(self, name):
+        builder = dict(self.view_builders)[name]
+        view = builder()
+        if view is None: # the table does not contain required columns
+            return gtk.Label("Data for this view were not exported.")
+        return view[1]
+
+    def _get_histograms(self):
+        if self.histograms is None:
+            net = self.tracelog.project.nets[0]
+            self.histograms = tet_histograms(
+                self.tracelog.data,
+                self.tracelog.get_processes(),
+                [ t for t in net.transitions() if t.trace_fire ])
+        return self.histograms
+
     def save_as_svg(self, filename):
         self.netinstance_view.save_as_svg(filename)
 
@@ -152,19 +251,21 @@ def process_utilization(table, processes):
 
     f_eq = lambda x, y: x == y
 
+    f_in = lambda x, y: (x == y[0]) | (x == y[1])
+
     columns = ["Time", "Duration"]
+    groups = table.group_by(["Event", "Process"],
+                            [("Event", f_in, ('I', 'T'))])
     # collect idles
-    filters = [("Event", f_eq, 'I')]
     idles = []
     for p in processes:
-        idles.append(table.select(columns, filters + [("Process", f_eq, p)]))
+        idles.append(groups.get(('I', p), columns))
 
     # collect TETs
-    filters = [("Event", f_eq, 'T')]
     names, values = [], []
     for p in processes:
         names.append(str(p))
-        values.append(table.select(columns, filters + [("Process", f_eq, p)]))
+        values.append(groups.get(('T', p), columns))
 
     names.reverse()
     values.reverse()
@@ -186,14 +287,13 @@ def transition_utilization(table, processes, transitions):
     columns = ["Time", "Duration"]
     filters = [("Event", f_eq, 'T')]
     if "Process" in header:
+        groups = table.group_by(["ID", "Process"], filters)
         names, values = [], []
         for p in processes:
             pnames, pvalues = [], []
             for t in transitions:
                 pnames.append("{0} {1}".format(t.get_name_or_id(), p))
-                pvalues.append(table.select(
-                    columns,
-                    filters + [("ID", f_eq, t.id), ("Process", f_eq, p)]))
+                pvalues.append(groups.get((t.id, p), columns))
             names.append(pnames)
             values.append(pvalues)
 
@@ -205,90 +305,96 @@ def transition_utilization(table, processes, transitions):
         values = reduce(f_concate, values, [])
         names = reduce(f_concate, names, [])
     else:
+        groups = table.group_by(["ID"], filters)
         names, values = [], []
         for t in transitions:
             names.append(t.get_name_or_id())
-            values.append(table.select(
-                columns, filters + [("ID", f_eq, t.id)]))
+            values.append(groups.get(t.id, columns))
 
     return ("Utilization of transitions",
             charts.utilization_chart(
                 names, values,
                 "Utilization of transitions", "Time", "Transition"))
 
-def tet_per_processes_and_transitions_histogram(table, processes, transitions):
-    required = ["Event", "Process", "Duration", "ID"]
+def tet_histograms(table, processes, transitions):
+    """ Bin TETs of all transitions on all processes at once; the TET
+    histograms are sums of these counts. """
+    required = ["Event", "Duration"]
     header = table.header
 
     if not all(item in header for item in required):
-       return
+        return
 
     f_eq = lambda x, y: x == y
-    columns = ["Duration"]
+    columns = [ c for c in ["Event", "Duration", "ID", "Process"]
+                if c in header ]
     filters = [("Event", f_eq, 'T')]
-    names, values = [], []
+    tets = table.select(columns, filters)
+    return chartdata.DurationHistograms(
+        tets["Duration"],
+        [ t.id for t in transitions ],
+        processes,
+        tets["ID"] if "ID" in header else None,
+        tets["Process"] if "Process" in header else None)
+
+def tet_per_processes_and_transitions_histogram(
+        table, histograms, processes, transitions):
+    required = ["Event", "Process", "Duration", "ID"]
+    header = table.header
+
+    if not all(item in header for item in required):
+       return
+
+    names, counts, percentiles = [], [], []
     for tran in transitions:
-        f = filters + [("ID", f_eq, tran.id)]
         for p in processes:
             names.append("{0}`{1}".format(tran.get_name_or_id(), p))
-            tets = table.select(columns, f + [("Process", f_eq, p)])
-
-            if len(tets) == 0: # tets is a numpy array
-                tets = [0] # data for a histogram chart must not be empty
-            values.append(tets)
+            counts.append(histograms.get_counts(tran.id, p))
+            percentiles.append(histograms.get_percentiles(tran.id, p))
 
     return ("Transition execution times (TETs)",
-            charts.histogram(
-                names, values, "Histogram of transition execution times",
-                "Duration [ms]", "Count"))
+            charts.binned_histogram(
+                names, histograms.edges, counts,
+                "Histogram of transition execution times",
+                "Duration [ms]", "Count", percentiles))
 
-def tet_per_processes_histogram(table, processes):
+def tet_per_processes_histogram(table, histograms, processes):
     required = ["Event", "Process", "Duration"]
     header = table.header
 
     if not all(item in header for item in required):
        return
 
-    f_eq = lambda x, y: x == y
-    columns = ["Duration"]
-    filters = [("Event", f_eq, 'T')]
-    names, values = [], []
+    names, counts, percentiles = [], [], []
     for p in processes:
         names.append("Process {0}".format(p))
-        tets = table.select(columns, filters + [("Process", f_eq, p)])
-
-        if len(tets) == 0:
-            tets = [0]
-        values.append(tets)
+        counts.append(histograms.get_counts(process=p))
+        percentiles.append(histograms.get_percentiles(process=p))
 
     return ("TETs (grouped by processes)",
-            charts.histogram(
-                names, values, "Histogram of transition execution times grouped by processes",
-                "Duration [ms]", "Count"))
+            charts.binned_histogram(
+                names, histograms.edges, counts,
+                "Histogram of transition execution times grouped by processes",
+                "Duration [ms]", "Count", percentiles))
 
-def tet_per_transitions_histogram(table, transitions):
+def tet_per_transitions_histogram(table, histograms, transitions):
     required = ["Event", "Duration", "ID"]
     header = table.header
 
     if not all(item in header for item in required):
        return
 
-    f_eq = lambda x, y: x == y
-    columns = ["Duration"]
-    filters = [("Event", f_eq, 'T')]
-    names, values = [], []
+    names, counts, percentiles = [], [], []
     for t in transitions:
         names.append(t.get_name_or_id())
-        tets = table.select(columns, filters + [("ID", f_eq, t.id)])
-
-        if len(tets) == 0:
-            tets = [0]
-        values.append(tets)
+        counts.append(histograms.get_counts(t.id))
+        percentiles.append(histograms.get_percentiles(t.id))
 
     return ("TETs (grouped by transitions)",
-            charts.histogram(
-                names, values, "Histogram of transition execution times grouped by transitions",
-                "Duration [ms]", "Count"))
+            charts.binned_histogram(
+                names, histograms.edges, counts,
+                "Histogram of transition execution times grouped by transitions",
+                "Duration [ms]", "Count", percentiles))
 
 def tokens_count(table, processes, places, collapse=True):
     required = ["Event", "Process", "Time"] + \
@@ -300,12 +406,13 @@ def tokens_count(table, processes, places, collapse=True):
 
     f_eq = lambda x, y: x == y
     filters = [("Event", f_eq, 'C')]
+    groups = table.group_by(["Process"], filters)
     names, values = [], []
     for place in places:
         columns = ["Time", place_counter_name(place)]
         for p in processes:
             names.append("{0}@{1}".format(place.get_name_or_id(), p))
-            counts = table.select(columns, filters + [("Process", f_eq, p)])
+            counts = groups.get(p, columns)
             values.append((counts[columns[0]], counts[columns[1]]))
 
     return ("Number of tokens",
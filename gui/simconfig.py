@@ -20,22 +20,6 @@
 import gtk
 import gtkutils
 
-class SimConfig:
-
-    process_count = 4
-    parameters_values = None
-    sequence = None
-
-    def reset_param_values(self):
-        self.parameters_values = None
-
-    def set_param_values(self, values):
-        self.parameters_values = values
-
-    def set_process_count(self, value):
-        self.process_count = value
-
-
 class SimConfigDialog(gtk.Dialog):
     """
         This dialog is used when the simulation needs to know values of parameters
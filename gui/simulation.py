@@ -228,7 +228,7 @@ class Simulation(EventSource):
         else:
             ids = process_ids
         for i in ids:
-            for j in xrange(self.process_count):
+            for j in self.runinstance.get_packet_origins(i):
                 for p in xrange(self.runinstance.get_packets_count(j, i)):
                     self.receive(i, j, query_reports=False)
         self.query_reports()
@@ -19,6 +19,10 @@
 
 import numpy as np
 
+# Number of added rows that are buffered before they are written into
+# the masked array
+ROWS_BLOCK_SIZE = 4096
+
 class Table(object):
 
     def __init__(self, columns, rows_number=10, init_data=True):
@@ -38,11 +42,27 @@ class Table(object):
         else:
             self.header, self.types = map(list, zip(*columns))
         self.rows_number = rows_number
+        self._data = None
         if init_data:
-            self.data = np.ma.zeros((self.rows_number,), dtype=columns)
+            self._data = np.ma.zeros((self.rows_number,), dtype=columns)
 
+        # Rows added by add_row(s) that are not written in the data yet
+        self._rows = []
         self.last_row_index = 0
 
+    @property
+    def data(self):
+        """ The masked structured array with the table; the buffered rows
+            are written into it on demand. """
+        if self._rows:
+            self._flush_rows()
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._rows = []
+        self._data = data
+
     @classmethod
     def create_from_data(cls, data):
         assert isinstance(data, np.ma.core.MaskedArray), \
@@ -91,22 +111,64 @@ class Table(object):
         row = tuple(row)
         assert len(row) == self.columns_number, \
                "The row has to have the same length as the table has columns."
+        self._rows.append(row)
+        self.last_row_index += 1
+        if len(self._rows) >= ROWS_BLOCK_SIZE:
+            self._flush_rows()
 
-        if self.last_row_index >= self.rows_number: # resize
-            self.rows_number *= 2
-            self.data = np.ma.resize(self.data, self.rows_number)
+    def add_rows(self, rows):
+        """ Add more rows at once. The rows can be given by an iterable of
+            rows or by a masked array with the same columns. """
+        if isinstance(rows, np.ma.MaskedArray):
+            self.data # flush buffered rows
+            self._reserve(self.last_row_index + len(rows))
+            end = self.last_row_index + len(rows)
+            self._data[self.last_row_index:end] = rows
+            self.last_row_index = end
+            return
+        for row in rows:
+            self.add_row(row)
 
-        for i, item in enumerate(row): # append row
-            if item is None: # invalid values
-                self.data.mask[self.last_row_index][i] = True
-            else:
-                self.data.mask[self.last_row_index][i] = False
-                self.data.data[self.last_row_index][i] = item
-        self.last_row_index += 1
+    extend = add_rows
 
     def trim(self):
         self.data = np.ma.resize(self.data, self.last_row_index)
 
+    def clear(self):
+        """ Remove all rows; allocated data are kept for next rows. """
+        self._rows = []
+        self.last_row_index = 0
+
+    def _reserve(self, rows_number):
+        if self._data is None:
+            self.rows_number = max(self.rows_number, rows_number)
+            self._data = np.ma.zeros((self.rows_number,),
+                                     dtype=zip(self.header, self.types))
+        elif rows_number > self.rows_number: # resize
+            self.rows_number = max(self.rows_number * 2, rows_number)
+            self._data = np.ma.resize(self._data, self.rows_number)
+
+    def _flush_rows(self):
+        rows = self._rows
+        self._rows = []
+        end = self.last_row_index
+        start = end - len(rows)
+        self._reserve(end)
+
+        if self._data._mask is np.ma.nomask:
+            self._data.mask = np.ma.getmaskarray(self._data)
+        # The block is written in place; assigning the whole mask would
+        # copy it on each flush
+        data, mask = self._data.data, self._data._mask
+        for i, name in enumerate(self.header):
+            column = [row[i] for row in rows]
+            column_mask = [item is None for item in column]
+            if any(column_mask): # invalid values
+                empty = np.zeros(1, dtype=data.dtype[name])[0]
+                column = [empty if item is None else item for item in column]
+            data[name][start:end] = column
+            mask[name][start:end] = column_mask
+
     def get_column(self, column):
         return self.data.data[self._get_colum_name(column)]
 
@@ -137,6 +199,48 @@ class Table(object):
             columns = columns[0]
         return self.data[mask][columns]
 
+    def group_by(self, columns, filters=[]):
+        """ Partition rows (that pass the filters) by values in columns.
+        It sorts the rows only once, so it is much faster than calling
+        `select` for each combination of values.
+
+        Arguments:
+        columns -- a list of names or indexes of columns
+        filters -- the same as in the `select` method
+
+        It returns GroupIndex.
+        """
+        if not isinstance(columns, list):
+            columns = [columns]
+        columns = [self._get_colum_name(column) for column in columns]
+        if not isinstance(filters, list):
+            filters = [filters]
+
+        data = self.data[:self.last_row_index]
+        mask = np.ones(self.last_row_index, dtype='bool')
+        for col, f_cmp, value in filters:
+            mask &= np.ma.filled(
+                f_cmp(data[self._get_colum_name(col)], value), False)
+        indexes = np.flatnonzero(mask)
+
+        keys = [data.data[column][indexes] for column in columns]
+        order = np.lexsort(keys[::-1]) # the first column is the primary key
+        keys = [k[order] for k in keys]
+        rows = data[indexes[order]]
+
+        changes = np.zeros(max(len(rows) - 1, 0), dtype='bool')
+        for k in keys:
+            changes |= k[1:] != k[:-1]
+        starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+        ends = np.concatenate((starts[1:], [len(rows)]))
+
+        groups = {}
+        if len(rows) > 0:
+            values = zip(*[k[starts].tolist() for k in keys])
+            for key, start, end in zip(values, starts, ends):
+                groups[key] = (start, end)
+        return GroupIndex(rows, groups)
+
     def _get_colum_name(self, column):
         if isinstance(column, int) and 0 <= column < self.columns_number:
             return self.header[column]
@@ -145,3 +249,36 @@ class Table(object):
         else:
             raise Exception("Invalid '{0}' column.".format(column))
 
+
+
+class GroupIndex(object):
+    """ Rows of a table partitioned by values of some columns, see
+        Table.group_by. """
+
+    def __init__(self, rows, groups):
+        self.rows = rows
+        self.groups = groups
+
+    def __len__(self):
+        return len(self.groups)
+
+    def keys(self):
+        return self.groups.keys()
+
+    def get(self, key, columns=None):
+        """ Return rows of a group in the same form as `Table.select`;
+        an empty array is returned for an unknown key.
+
+        Arguments:
+        key -- a tuple of values (one per grouped column)
+        columns -- a list of names of columns
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        start, end = self.groups.get(key, (0, 0))
+        rows = self.rows[start:end]
+        if columns is None:
+            return rows
+        if isinstance(columns, list) and len(columns) == 1:
+            columns = columns[0]
+        return rows[columns]
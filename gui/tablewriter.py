@@ -0,0 +1,180 @@
+#
+#    Copyright (C) 2014 Martin Surkovsky
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import csv
+import os
+import struct
+import numpy as np
+from collections import OrderedDict
+from table import Table
+
+# Number of rows kept in memory before they are written into the output
+CHUNK_SIZE = 65536
+
+# A fixed size of .npy headers, the header of a column file is rewritten
+# by the final shape when the writer is closed
+NPY_HEADER_SIZE = 128
+
+COLUMNS_FILENAME = "columns.csv"
+
+
+class TableWriter(object):
+    """ A table-like object that writes rows into a file in chunks of fixed
+        size instead of keeping them in memory. It can be used by
+        ExportRunInstance instead of Table. Subclasses write chunks by
+        the method 'write_chunk(chunk)' and may finish the output
+        in 'close_output'. """
+
+    def __init__(self, columns, chunk_size=CHUNK_SIZE):
+        """ Arguments:
+        columns -- a list of couples (name, data type)
+        chunk_size -- a number of rows in one chunk
+        """
+        self.chunk = Table(columns, chunk_size)
+        self.header = self.chunk.header
+        self.types = self.chunk.types
+        self.chunk_size = chunk_size
+        self.rows_count = 0
+
+    def __len__(self):
+        return self.rows_count + len(self.chunk)
+
+    def add_row(self, row):
+        self.chunk.add_row(row)
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add_row(row)
+
+    def flush(self):
+        if len(self.chunk) > 0:
+            self.write_chunk(self.chunk)
+            self.rows_count += len(self.chunk)
+            self.chunk.clear()
+
+    def close(self):
+        self.flush()
+        self.close_output()
+
+    def close_output(self):
+        pass
+
+
+class CsvTableWriter(TableWriter):
+
+    def __init__(self,
+                 filename,
+                 columns,
+                 settings=(",", "\"", True, True),
+                 chunk_size=CHUNK_SIZE):
+        """ Arguments:
+        filename -- a name of the output file
+        columns -- a list of couples (name, data type)
+        settings -- (delimiter, quotechar, has_header, has_types), the same as
+        settings of datatypes.store_csv
+        """
+        TableWriter.__init__(self, columns, chunk_size)
+        delimiter, quotechar, has_header, has_types = settings
+        self.file = open(filename, "w")
+        self.csvwriter = csv.writer(
+            self.file, delimiter=delimiter, quotechar=quotechar)
+        if has_types:
+            self.csvwriter.writerow(self.types)
+        if has_header:
+            self.csvwriter.writerow(self.header)
+
+    def write_chunk(self, chunk):
+        self.csvwriter.writerows(chunk)
+
+    def close_output(self):
+        self.file.close()
+
+
+class NpyTableWriter(TableWriter):
+    """ Writes a table into a directory; every column is stored in its own
+        .npy file ('<index>.npy') together with a mask of missing values
+        ('<index>.mask.npy'). Names and types of columns are stored in
+        'columns.csv'. """
+
+    def __init__(self, directory, columns, chunk_size=CHUNK_SIZE):
+        TableWriter.__init__(self, columns, chunk_size)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with open(os.path.join(directory, COLUMNS_FILENAME), "w") as f:
+            csvwriter = csv.writer(f)
+            csvwriter.writerow(self.types)
+            csvwriter.writerow(self.header)
+
+        self.files = []
+        for i, name in enumerate(self.header):
+            dtype = self.chunk.data.dtype[name]
+            data_file = open(_column_filename(directory, i), "wb")
+            mask_file = open(_column_filename(directory, i, True), "wb")
+            data_file.write(_npy_header(dtype, 0))
+            mask_file.write(_npy_header(np.dtype(bool), 0))
+            self.files.append((dtype, data_file, mask_file))
+
+    def write_chunk(self, chunk):
+        size = len(chunk)
+        mask = np.ma.getmaskarray(chunk.data)
+        for name, (dtype, data_file, mask_file) in zip(self.header, self.files):
+            data_file.write(chunk.data.data[name][:size].tostring())
+            mask_file.write(mask[name][:size].tostring())
+
+    def close_output(self):
+        for dtype, data_file, mask_file in self.files:
+            for f, t in ((data_file, dtype), (mask_file, np.dtype(bool))):
+                f.seek(0)
+                f.write(_npy_header(t, self.rows_count))
+                f.close()
+        self.files = []
+
+
+def load_npy_table(directory, mmap_mode=None):
+    """ Load a table stored by NpyTableWriter. It returns an ordered
+        dictionary that maps names of columns to masked arrays; the arrays
+        wrap the loaded (or memory-mapped) data and masks without copying
+        them. """
+    with open(os.path.join(directory, COLUMNS_FILENAME), "rb") as f:
+        csvreader = csv.reader(f)
+        csvreader.next() # types
+        header = csvreader.next()
+
+    columns = OrderedDict()
+    for i, name in enumerate(header):
+        column = np.load(_column_filename(directory, i), mmap_mode=mmap_mode)
+        mask = np.load(_column_filename(directory, i, True), mmap_mode=mmap_mode)
+        columns[name] = np.ma.MaskedArray(column, mask=mask, copy=False)
+    return columns
+
+def _column_filename(directory, index, mask=False):
+    if mask:
+        return os.path.join(directory, "{0}.mask.npy".format(index))
+    return os.path.join(directory, "{0}.npy".format(index))
+
+def _npy_header(dtype, rows):
+    header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': ({1},), }}" \
+        .format(np.lib.format.dtype_to_descr(dtype), rows)
+    # magic string (6), version (2), length of header (2), header, '\n'
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    return "\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header
@@ -21,55 +21,164 @@
 import xml.etree.ElementTree as xml
 import utils
 import loader
+import mmap
+import multiprocessing
+import os
 import struct
+import threading
+import zipfile
 import controlseq
+import exportri
+import numpy as np
 
+from collections import OrderedDict
 from table import Table
 from runinstance import RunInstance
-from exportri import ExportRunInstance, place_counter_name
+from exportri import ExportRunInstance
 
 zero_char = chr(0)
 
+# Tracelogs whose traces are bigger than this size (in bytes) are loaded lazily
+LAZY_LOAD_SIZE = 256 * 1024 * 1024
+
+# A copy of the run instance is stored after each CHECKPOINT_INTERVAL visible
+# events; copies are kept while their estimated size (in bytes) fits into
+# CHECKPOINTS_MEMORY
+CHECKPOINT_INTERVAL = 500
+CHECKPOINTS_MEMORY = 256 * 1024 * 1024
+
+# Version of the format of index files (<tracelog>.kth.idx)
+INDEX_VERSION = 1
+
+# Traces are decoded by a pool of processes when their total size (in bytes)
+# is bigger than PARALLEL_LOAD_SIZE
+PARALLEL_LOAD_SIZE = 32 * 1024 * 1024
+
+# Replay of events reports its progress after each PROGRESS_STEP events
+PROGRESS_STEP = 10000
+
+# Decoded numbers are converted into numpy arrays after each RECORDER_CHUNK
+# events, so Python objects are kept only for the last chunk
+RECORDER_CHUNK = 65536
+
+class TraceFilter:
+    """ A part of a tracelog that is loaded. None means no restriction.
+
+        start, end -- a time window (in nanoseconds from the start of
+                      the tracelog); events before 'start' are only replayed
+                      to get the initial state of the window
+        processes -- a list of loaded processes
+        kinds -- characters of shown events (e.g. "TF"); other events are
+                 replayed, but the replay does not stop on them
+    """
+
+    def __init__(self, start=None, end=None, processes=None, kinds=None):
+        self.start = start
+        self.end = end
+        self.processes = processes
+        self.kinds = kinds
+
+    def is_process_loaded(self, process_id):
+        return self.processes is None or process_id in self.processes
+
+
 class TraceLog:
 
-    def __init__(self, filename, export_data=False):
-        self.filename = filename
-        self.export_data = export_data
-        self._read_header()
+    def __init__(self, filename, export_data=False, lazy=None, progress=None,
+                 filter=None, checkpoints_memory=CHECKPOINTS_MEMORY):
+        """ If 'lazy' is True, trace files are memory-mapped and only the
+            index of events is kept in memory, events are parsed from the
+            mapped files when they are processed. If 'lazy' is None, the
+            mode is chosen by the total size of traces. The index still
+            grows with the number of events (21 bytes per event and 8 bytes
+            per event in each timeline), so traces may be bigger than
+            memory but their index may not.
 
-        self.traces = [None] * self.process_count
-        for process_id in xrange(self.process_count):
-            self._read_trace(process_id)
+            'progress' is called as progress(done, total) during loading;
+            loading can be cancelled by raising an exception from it.
 
-        self.first_runinstance = RunInstance(self.project, self.process_count)
+            'filter' (TraceFilter) restricts loaded processes and events.
 
-        self._preprocess()
+            'checkpoints_memory' is a budget (in bytes) for copies of run
+            instances that speed up random access to events. """
+        self.filename = filename
+        self.export_data = export_data
+        self.filter = filter
+        self._read_header()
 
-    def execute_visible_events(self, ri, from_event=0, to_event=None):
-        if to_event is None:
-            to_event = len(self.timeline)
-        for i in xrange(from_event, to_event):
-            event_pointer = self.timeline[i]
-            trace = self.traces[event_pointer["process"]]
-            trace.pointer = event_pointer["pointer"]
-            trace.process_event(ri)
-        return ri
+        traces_size = sum(os.path.getsize(self._get_trace_filename(process_id))
+                          for process_id in xrange(self.process_count))
+        if lazy is None:
+            lazy = traces_size > LAZY_LOAD_SIZE
+        self.lazy = lazy
+        self.parallel = traces_size > PARALLEL_LOAD_SIZE and \
+                        self.process_count > 1 and \
+                        multiprocessing.cpu_count() > 1
+
+        self.first_runinstance = RunInstance(self.project,
+                                             self.process_count,
+                                             self.get_loaded_processes())
+        self.prefix_timeline = None # Visible events before the time window
+        # Events may be replayed from a background thread
+        self.lock = threading.RLock()
+        self.checkpoints = Checkpoints(self,
+                                       CHECKPOINT_INTERVAL,
+                                       checkpoints_memory)
 
-    def execute_all_events(self, ri,from_event=0, to_event=None):
-        if to_event is None:
-            to_event = len(self.full_timeline)
-        for i in xrange(from_event, to_event):
-            event_pointer = self.full_timeline[i]
-            trace = self.traces[event_pointer["process"]]
-            trace.pointer = event_pointer["pointer"]
-            trace.process_event(ri)
-        return ri
+        self.traces = [None] * self.process_count
+        self.data = None
+        self.shown = None # Positions of shown events in the timeline
+        if not self._load_index():
+            self._read_traces(progress)
+            self._preprocess(progress)
+            if self.filter is None:
+                # The index of a filtered tracelog would be incomplete
+                self._save_index()
+        elif self.export_data and self.data is None and self.filter is None:
+            self._export_data(progress)
+            self._save_index()
+        if self.filter is not None:
+            self._apply_filter(progress)
+
+    def execute_visible_events(self, ri, from_event=0, to_event=None,
+                               progress=None):
+        return self._execute_events(
+            self.timeline, ri, from_event, to_event, progress)
+
+    def execute_all_events(self, ri,from_event=0, to_event=None,
+                           progress=None):
+        return self._execute_events(
+            self.full_timeline, ri, from_event, to_event, progress)
+
+    def get_event_runinstance(self, index, progress=None):
+        """ Return run instance after 'index' visible events. The returned
+            instance may be changed by the next call of this method.
+            'progress' is called as progress(done, total) between replayed
+            blocks of events; an exception raised from it stops the replay
+            safely. """
+        return self.checkpoints.get_runinstance(self._get_position(index),
+                                                progress)
+
+    def get_processes(self):
+        """ Return a list of loaded processes. """
+        return [ process_id for process_id in xrange(self.process_count)
+                 if self.filter is None or
+                    self.filter.is_process_loaded(process_id) ]
+
+    def get_loaded_processes(self):
+        """ Return a set of loaded processes or None when all processes
+            are loaded. """
+        if self.filter is None or self.filter.processes is None:
+            return None
+        return frozenset(self.get_processes())
 
-    def get_event_runinstance(self, index):
-        return self.execute_visible_events(
-            self.first_runinstance.copy(), 0, index)
+    def get_start_time(self):
+        if self.filter is None or self.filter.start is None:
+            return 0
+        return self.filter.start
 
     def get_event_process(self, index):
+        index = self._get_position(index)
         if index == 0:
             return "X"
         index -= 1
@@ -77,49 +186,91 @@ class TraceLog:
         return event_pointer["process"]
 
     def get_event_time(self, index):
+        index = self._get_position(index)
         if index == 0:
-            return 0
+            return self.get_start_time()
         index -= 1
         event_pointer = self.timeline[index]
         trace = self.traces[event_pointer["process"]]
-        trace.pointer = event_pointer["pointer"]
-        return trace.get_next_event_time()
+        return trace.get_event_time(event_pointer["event"])
 
     def get_event_name(self, index):
+        index = self._get_position(index)
         if index == 0:
             return "Init "
         index -= 1
         event_pointer = self.timeline[index]
         trace = self.traces[event_pointer["process"]]
-        trace.pointer = event_pointer["pointer"]
-        return trace.get_next_event_name()
+        return trace.get_event_name(event_pointer["event"])
 
     def get_runinstances_count(self):
+        if self.shown is not None:
+            return len(self.shown) + 1
         return len(self.timeline) + 1
 
     def get_max_time(self):
-        return self.get_event_time(len(self.timeline))
-
-    def export_sequence(self, index):
+        return self.get_event_time(self.get_runinstances_count() - 1)
+
+    def export_sequence(self, index, progress=None):
+        """ Return a control sequence that leads from the beginning of the
+            computation to the state after 'index' visible events; visible
+            events before the time window of the filter are included.
+            'progress' is the same as in get_event_runinstance. """
+        if self.get_loaded_processes() is not None and \
+                len(self.get_processes()) < self.process_count:
+            raise Exception("Control sequence cannot be exported when "
+                            "only some processes are loaded")
         time = utils.time_to_string(self.get_event_time(index))
         name = "Tracelog upto {0}".format(time)
         sequence = controlseq.ControlSequence(name)
-        ri = self.first_runinstance.copy()
-        for i in xrange(index):
-            event_pointer = self.timeline[i]
-            trace = self.traces[event_pointer["process"]]
-            trace.pointer = event_pointer["pointer"]
-            trace.process_event(ri)
-            if ri.last_event == "fire":
-                sequence.add_transition_start(ri.last_event_process,
-                                              ri.last_event_activity.transition.get_name())
-            elif ri.last_event == "finish":
-                sequence.add_transition_finish(ri.last_event_process)
-            elif ri.last_event == "receive":
-                sequence.add_receive(ri.last_event_process,
-                                     ri.last_event_activity.origin_id)
+        ri = RunInstance(self.project, self.process_count)
+        replay = [ (self.timeline, self._get_position(index)) ]
+        if self.prefix_timeline is not None:
+            replay.insert(0, (self.prefix_timeline, len(self.prefix_timeline)))
+        total = sum(count for timeline, count in replay)
+        done = 0
+        for timeline, count in replay:
+            for i in xrange(count):
+                if progress and done % PROGRESS_STEP == 0:
+                    progress(done, total)
+                done += 1
+                self._execute_events(timeline, ri, i, i + 1, None)
+                if ri.last_event == "fire":
+                    sequence.add_transition_start(ri.last_event_process,
+                                                  ri.last_event_activity.transition.get_name())
+                elif ri.last_event == "finish":
+                    sequence.add_transition_finish(ri.last_event_process)
+                elif ri.last_event == "receive":
+                    sequence.add_receive(ri.last_event_process,
+                                         ri.last_event_activity.origin_id)
         return sequence
 
+    def _execute_events(self, timeline, ri, from_event, to_event, progress):
+        if to_event is None:
+            to_event = len(timeline)
+        processes = timeline.get_column("process")
+        events = timeline.get_column("event")
+        traces = self.traces
+        with self.lock:
+            if progress is None:
+                for i in xrange(from_event, to_event):
+                    traces[processes[i]].process_event(events[i], ri)
+                return ri
+
+            total = to_event - from_event
+            for start in xrange(from_event, to_event, PROGRESS_STEP):
+                progress(start - from_event, total)
+                for i in xrange(start, min(start + PROGRESS_STEP, to_event)):
+                    traces[processes[i]].process_event(events[i], ri)
+            progress(total, total)
+            return ri
+
+    def _get_position(self, index):
+        """ Convert an index of a shown event to a position in the timeline """
+        if self.shown is None or index == 0:
+            return index
+        return int(self.shown[index - 1]) + 1
+
     def _read_header(self):
         with open(self.filename, "r") as f:
             header = xml.fromstring(f.readline())
@@ -128,67 +279,336 @@ class TraceLog:
             x = xml.fromstring(f.read())
             self.project = loader.load_project_from_xml(x, "")
 
-    def _read_trace(self, process_id):
-        filename = "{0}-{1}-0.ktt".format(
+    def _get_trace_filename(self, process_id):
+        return "{0}-{1}-0.ktt".format(
             utils.trim_filename_suffix(self.filename),
             process_id)
-        with open(filename, "rb") as f:
-            trace = Trace(f.read(), process_id, self.pointer_size)
-            self.traces[process_id] = trace
 
-    def _preprocess(self):
+    def _open_trace(self, process_id, use_mmap=None):
+        if use_mmap is None:
+            use_mmap = self.lazy
+        return open_trace(self._get_trace_filename(process_id),
+                          process_id,
+                          self.pointer_size,
+                          use_mmap)
+
+    def _get_end_times(self):
+        """ Return times (without time offsets) of traces after which events
+            are not decoded. """
+        if self.filter is None or self.filter.end is None:
+            return [ None ] * self.process_count
+        # Only headers of traces are read
+        init_times = [ self._open_trace(process_id, True).get_init_time()
+                       for process_id in xrange(self.process_count) ]
+        starttime = min(init_times)
+        return [ self.filter.end - (init_time - starttime)
+                 for init_time in init_times ]
+
+    def _read_traces(self, progress=None):
+        end_times = self._get_end_times()
+        processes = self.get_processes()
+        for process_id in xrange(self.process_count):
+            if process_id not in processes:
+                trace = self._open_trace(process_id, True)
+                self.traces[process_id] = TraceRecorder(True) \
+                    .get_events(process_id)
+                self.traces[process_id].info = trace.info
+
+        if not self.parallel or len(processes) < 2:
+            for i, process_id in enumerate(processes):
+                if progress:
+                    progress(i, len(processes))
+                trace = self._open_trace(process_id)
+                self.traces[process_id] = trace.decode(self.lazy,
+                                                       end_times[process_id])
+            return
+
+        pool = multiprocessing.Pool(
+            min(multiprocessing.cpu_count(), len(processes)))
+        try:
+            results = pool.imap_unordered(
+                decode_trace_in_worker,
+                [ (self._get_trace_filename(process_id),
+                   process_id,
+                   self.pointer_size,
+                   self.lazy,
+                   end_times[process_id]) for process_id in processes ])
+            for i, events in enumerate(results):
+                if progress:
+                    progress(i, len(processes))
+                if self.lazy:
+                    events.trace = self._open_trace(events.process_id)
+                self.traces[events.process_id] = events
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+
+    def _get_index_filename(self):
+        return self.filename + ".idx"
+
+    def _get_index_key(self):
+        """ Sizes and modification times of all files of the tracelog """
+        key = []
+        filenames = [ self.filename ] + \
+                    [ self._get_trace_filename(process_id)
+                      for process_id in xrange(self.process_count) ]
+        for filename in filenames:
+            stat = os.stat(filename)
+            key.append(stat.st_size)
+            key.append(int(stat.st_mtime * 1000000))
+        return np.array(key, dtype="<i8")
+
+    def _load_index(self):
+        """ Load traces, timelines and export data from the index file.
+            Returns False if there is no valid index; a corrupted index
+            is removed. """
+        filename = self._get_index_filename()
+        try:
+            with open(filename, "rb") as f:
+                index = np.load(f, allow_pickle=False)
+                if int(index["version"]) != INDEX_VERSION or \
+                        not np.array_equal(index["key"], self._get_index_key()):
+                    return False
+                offsets = index["offsets"]
+                counts = np.cumsum([ 0 ] + list(index["counts"]))
+                columns = [ index[name]
+                            for name in ("kinds", "pointers", "times", "ids") ]
+                for process_id in xrange(self.process_count):
+                    start, end = counts[process_id], counts[process_id + 1]
+                    events = TraceEvents(
+                        process_id, *[ c[start:end] for c in columns ])
+                    events.trace = self._open_trace(process_id)
+                    events.info = events.trace.info
+                    events.time_offset = int(offsets[process_id])
+                    self.traces[process_id] = events
+                self.full_timeline = self._create_timeline(
+                    index["full_processes"], index["full_events"])
+                self.timeline = self._create_timeline(
+                    index["processes"], index["events"])
+                if "data" in index.files:
+                    data = np.ma.MaskedArray(index["data"], mask=index["mask"])
+                    self.data = Table.create_from_data(data)
+                elif not self.export_data:
+                    self.data = Table([], 0)
+                return True
+        except (IOError, OSError):
+            return False
+        except (zipfile.BadZipfile, KeyError, ValueError):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return False
+
+    def _save_index(self):
+        arrays = {
+            "version": np.array(INDEX_VERSION),
+            "key": self._get_index_key(),
+            "offsets": np.array([ trace.time_offset for trace in self.traces ],
+                                dtype="<i8"),
+            "counts": np.array([ len(trace) for trace in self.traces ],
+                               dtype="<i8"),
+            "full_processes": self.full_timeline.get_column("process"),
+            "full_events": self.full_timeline.get_column("event"),
+            "processes": self.timeline.get_column("process"),
+            "events": self.timeline.get_column("event")
+        }
+        for name in ("kinds", "pointers", "times", "ids"):
+            arrays[name] = np.concatenate(
+                [ getattr(trace, name) for trace in self.traces ])
+        if self.export_data:
+            arrays["data"] = self.data.data.data
+            arrays["mask"] = np.ma.getmaskarray(self.data.data)
+
+        filename = self._get_index_filename()
+        tmp_filename = "{0}.{1}.tmp".format(filename, os.getpid())
+        try:
+            with open(tmp_filename, "wb") as f:
+                np.savez(f, **arrays)
+            os.rename(tmp_filename, filename)
+        except (IOError, OSError):
+            # The index is only a cache; a tracelog in read-only directory
+            # is just loaded without it
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    def _preprocess(self, progress=None):
         # Set time offsets
         starttime = min([ trace.get_init_time() for trace in self.traces ])
         for trace in self.traces:
             trace.time_offset = trace.get_init_time() - starttime
-        trace_times = [ trace.get_next_event_time() for trace in self.traces ]
 
-        if self.export_data:
-            place_counters = [place_counter_name(p)
-                              for p in self.project.nets[0].places()
-                              if p.trace_tokens]
-
-            ri = ExportRunInstance(
-                self,
-                [ t for t in self.project.nets[0].transitions() if t.trace_fire ],
-                [ (p, i) for p in self.project.nets[0].places()
-                         for i, tracing in enumerate(p.trace_tokens_functions)
-                         if tracing.return_numpy_type != 'O' ],
-                ExportRunInstance.basic_header + place_counters)
-        else:
-            ri = RunInstance(
-                self.project, self.process_count)
+        processes, events = utils.merge_times(
+            [ trace.get_times() for trace in self.traces ])
+        visible = np.concatenate(
+            [ np.zeros(0, dtype=bool) ] +
+            [ trace.get_visible_mask() for trace in self.traces ])
+        # Indexes of events in the concatenation of all traces
+        offsets = np.cumsum([ 0 ] + [ len(trace) for trace in self.traces ])
+        visible = visible[offsets[processes] + events]
 
-        index = 0
-        timeline = Table([("process", "<i4"), ("pointer", "<i4")], 100)
-        full_timeline = Table([("process", "<i4"), ("pointer", "<i4")], 100)
-        while True:
+        self.full_timeline = self._create_timeline(processes, events)
+        self.timeline = self._create_timeline(processes[visible],
+                                              events[visible])
 
-            # Searching for trace with minimal event time
-            minimal_time_index = utils.index_of_minimal_value(trace_times)
-            if minimal_time_index is None:
-                break
-
-            trace = self.traces[minimal_time_index]
-
-            full_timeline.add_row((minimal_time_index, trace.pointer))
+        self.data = Table([], 0)
+        if self.export_data and self.filter is None:
+            self._export_data(progress)
+
+    def _apply_filter(self, progress=None):
+        """ Restrict timelines by the filter. Timelines are sorted by time,
+            so the time window is found by a binary search. Visible events
+            before the window are kept in the prefix timeline and replayed
+            into the first run instance. """
+        offsets = np.cumsum([ 0 ] + [ len(trace) for trace in self.traces ])
+        times = np.concatenate([ np.zeros(0, dtype="<i8") ] +
+                               [ trace.get_times() for trace in self.traces ])
+        kinds = np.concatenate([ np.zeros(0, dtype="|S1") ] +
+                               [ trace.kinds for trace in self.traces ])
+
+        def restrict(timeline):
+            processes = timeline.get_column("process")
+            events = timeline.get_column("event")
+            positions = offsets[processes] + events
+            if self.filter.end is not None:
+                end = np.searchsorted(times[positions], self.filter.end,
+                                      "right")
+                processes, events = processes[:end], events[:end]
+                positions = positions[:end]
+            if self.filter.processes is not None:
+                loaded = np.in1d(processes, self.get_processes())
+                processes, events = processes[loaded], events[loaded]
+                positions = positions[loaded]
+            return processes, events, positions
+
+        # The full timeline keeps events before the window; they are needed
+        # by run instances that replay the tracelog from its beginning
+        # (e.g. the export)
+        processes, events, positions = restrict(self.full_timeline)
+        self.full_timeline = self._create_timeline(processes, events)
+
+        processes, events, positions = restrict(self.timeline)
+        start = np.searchsorted(times[positions], self.get_start_time(), "left")
+        self.prefix_timeline = self._create_timeline(processes[:start],
+                                                     events[:start])
+        self._execute_events(self.prefix_timeline,
+                             self.first_runinstance, 0, None, progress)
+        self.timeline = self._create_timeline(processes[start:], events[start:])
+        if self.filter.kinds is not None:
+            self.shown = np.flatnonzero(
+                np.in1d(kinds[positions[start:]], list(self.filter.kinds)))
+
+        self.checkpoints.clear()
+        self.data = Table([], 0)
+        if self.export_data:
+            self._export_data(progress)
 
-            # Timeline update
-            if trace.is_next_event_visible():
-                timeline.add_row(full_timeline[index])
+    def _export_data(self, progress=None):
+        ri = ExportRunInstance(self, *exportri.default_settings(self.project))
+        self.execute_all_events(ri, progress=progress)
+        self.data = ri.get_table()
 
-            trace.process_event(ri)
-            trace_times[minimal_time_index] = trace.get_next_event_time()
+    def _create_timeline(self, processes, events):
+        data = np.ma.zeros((len(processes),),
+                           dtype=[("process", "<i4"), ("event", "<i4")])
+        data["process"] = processes
+        data["event"] = events
+        return Table.create_from_data(data)
 
-            index += 1
 
-        self.data = Table([], 0)
-        if self.export_data:
-            self.data = ri.get_table()
+def open_trace(filename, process_id, pointer_size, use_mmap=False):
+    with open(filename, "rb") as f:
+        if use_mmap:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+    return Trace(data, process_id, pointer_size)
+
+def decode_trace_in_worker(args):
+    """ Decode one trace file in a process of multiprocessing.Pool """
+    filename, process_id, pointer_size, index_only, end_time = args
+    events = open_trace(filename, process_id, pointer_size, index_only) \
+                 .decode(index_only, end_time)
+    # The trace is not sent back, the parent opens its own one if needed
+    events.trace = None
+    return events
+
+
+class Checkpoints:
+    """ Copies of run instances stored after each 'interval' visible events;
+        copies are kept while their estimated size fits into 'memory' bytes
+        (the least recently used ones are dropped). A run instance for any
+        index is obtained by replaying at most 'interval' events from
+        the nearest checkpoint, or by continuing from the last returned
+        instance when moving forward.
+    """
+
+    def __init__(self, tracelog, interval, memory):
+        self.tracelog = tracelog
+        self.interval = interval
+        self.memory = memory
+        # index -> (runinstance, estimated size), in LRU order
+        self.checkpoints = OrderedDict()
+        self.size = 0 # Estimated size of all checkpoints
+        self.runinstance = None # The last returned run instance
+        self.index = None
+
+    def clear(self):
+        self.checkpoints.clear()
+        self.size = 0
+        self.runinstance = None
+        self.index = None
+
+    def get_runinstance(self, index, progress=None):
+        with self.tracelog.lock:
+            return self._get_runinstance(index, progress)
+
+    def _get_runinstance(self, index, progress):
+        start = (index // self.interval) * self.interval
+        while start > 0 and start not in self.checkpoints:
+            start -= self.interval
+
+        if self.runinstance is not None and start <= self.index <= index:
+            ri = self.runinstance
+            position = self.index
+        else:
+            if start == 0:
+                ri = self.tracelog.first_runinstance.copy()
+            else:
+                checkpoint = self.checkpoints.pop(start)
+                self.checkpoints[start] = checkpoint
+                ri = checkpoint[0].copy()
+            position = start
+
+        first_position = position
+        while position < index:
+            if progress:
+                # the state is consistent here, so the replay can be stopped
+                self.runinstance = ri
+                self.index = position
+                progress(position - first_position, index - first_position)
+            next_checkpoint = (position // self.interval + 1) * self.interval
+            end = min(index, next_checkpoint)
+            self.tracelog.execute_visible_events(ri, position, end)
+            position = end
+            if position == next_checkpoint and \
+                    position not in self.checkpoints:
+                self._store(position, ri.copy())
+
+        self.runinstance = ri
+        self.index = index
+        return ri
 
-        timeline.trim()
-        full_timeline.trim()
-        self.timeline, self.full_timeline = timeline, full_timeline
+    def _store(self, index, runinstance):
+        size = runinstance.estimate_size()
+        self.checkpoints[index] = (runinstance, size)
+        self.size += size
+        while self.size > self.memory:
+            runinstance, size = self.checkpoints.popitem(last=False)[1]
+            self.size -= size
 
 
 class Trace:
@@ -206,7 +626,10 @@ class Trace:
     struct_double = struct.Struct("<d")
 
     def __init__(self, data, process_id, pointer_size):
+        """ 'data' may be a string or any buffer (mmap, buffer, memoryview),
+            it is never copied as a whole """
         self.data = data
+        self.find = getattr(data, "find", None)
         self.pointer = 0
         self.process_id = process_id
         self.time_offset = 0
@@ -274,6 +697,32 @@ class Trace:
     def is_pointer_at_end(self):
         return self.pointer >= len(self.data)
 
+    def decode(self, index_only=False, end_time=None):
+        """ Read the whole trace in one pass and return its events
+            as a columnar TraceEvents.
+
+            If 'index_only' is True then only kinds, times, ids and pointers
+            of events are stored. Such TraceEvents keeps a reference to this
+            trace and parses operations of an event from the data when the
+            event is processed.
+
+            If 'end_time' is not None, the rest of the trace after the first
+            event later than 'end_time' (without the time offset) is skipped.
+        """
+        recorder = TraceRecorder(index_only)
+        while not self.is_pointer_at_end():
+            if end_time is not None and self.struct_basic.unpack_from(
+                    self.data, self.pointer + 1)[0] > end_time:
+                break
+            recorder.start_event(self.data[self.pointer], self.pointer)
+            self.process_event(recorder)
+        events = recorder.get_events(self.process_id)
+        events.info = self.info
+        events.time_offset = self.time_offset
+        if index_only:
+            events.trace = self
+        return events
+
     def process_tokens_add(self, runinstance, send_time=0):
         place_id = None
         token_pointer = None
@@ -461,10 +910,15 @@ class Trace:
 
     def _read_cstring(self):
         start = self.pointer
-        while self.data[self.pointer] != zero_char:
-            self.pointer += 1
+        if self.find is not None:
+            self.pointer = self.find(zero_char, start)
+        else:
+            while self.data[self.pointer] != zero_char:
+                self.pointer += 1
         s = self.data[start:self.pointer]
         self.pointer += 1
+        if isinstance(s, memoryview):
+            return s.tobytes()
         return s
 
     def _read_transition_trace_function_data(self):
@@ -489,3 +943,273 @@ class Trace:
             else:
                 break
         return values
+
+
+class RecorderColumn:
+    """ A column of numbers appended one by one; they are kept in a list
+        until they are moved into a numpy array by 'flush'. """
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.chunks = []
+        self.items = []
+        self.append = self.items.append
+        self.flushed = 0
+
+    def __len__(self):
+        return self.flushed + len(self.items)
+
+    def flush(self):
+        if self.items:
+            self.chunks.append(np.array(self.items, dtype=self.dtype))
+            self.flushed += len(self.items)
+            del self.items[:]
+
+    def get_array(self):
+        self.flush()
+        if len(self.chunks) == 1:
+            return self.chunks[0]
+        return np.concatenate([ np.zeros(0, dtype=self.dtype) ] + self.chunks)
+
+
+class TraceRecorder:
+    """ Runinstance-like object that stores all calls made by Trace into
+        columns of TraceEvents instead of changing any state. Events are
+        stored per row, token and send operations of an event are stored
+        as a continuous range of operations (ops).
+    """
+
+    def __init__(self, index_only=False):
+        self.index_only = index_only
+        self.kinds = RecorderColumn("|S1")
+        self.pointers = RecorderColumn("<u8")
+        self.times = RecorderColumn("<i8")
+        self.ids = RecorderColumn("<i4")
+        self.values = []
+        self.op_starts = RecorderColumn("<i8")
+
+        self.op_kinds = RecorderColumn("|S1")
+        self.op_times = RecorderColumn("<i8")
+        self.op_ids = RecorderColumn("<i4")
+        self.op_data = RecorderColumn("<u8")
+        self.op_values = []
+        self.columns = [ self.kinds, self.pointers, self.times, self.ids,
+                         self.op_starts, self.op_kinds, self.op_times,
+                         self.op_ids, self.op_data ]
+
+    def start_event(self, kind, pointer):
+        if len(self.kinds.items) >= RECORDER_CHUNK:
+            for column in self.columns:
+                column.flush()
+        self.kind = kind
+        self.kinds.append(kind)
+        self.pointers.append(pointer)
+        self.op_starts.append(len(self.op_kinds))
+
+    def _set_event(self, time, id=-1, values=None):
+        self.times.append(time)
+        self.ids.append(id)
+        if not self.index_only:
+            self.values.append(values)
+
+    def _add_op(self, kind, time=0, id=-1, data=0, values=None):
+        if self.index_only:
+            return
+        self.op_kinds.append(kind)
+        self.op_times.append(time)
+        self.op_ids.append(id)
+        self.op_data.append(data)
+        self.op_values.append(values)
+
+    def pre_event(self):
+        pass
+
+    def transition_fired(self, process_id, time, transition_id, values):
+        self._set_event(time, transition_id, values)
+
+    def transition_finished(self, process_id, time):
+        self._set_event(time)
+
+    def event_receive(self, process_id, time, origin_id):
+        self._set_event(time, origin_id)
+        return 0
+
+    def event_spawn(self, process_id, time, net_id):
+        self._set_event(time, net_id)
+
+    def event_idle(self, process_id, time):
+        self._set_event(time)
+
+    def event_quit(self, process_id, time):
+        if self.kind == "Q":
+            self._set_event(time)
+        else:
+            self._add_op("Q", time)
+
+    def event_end(self, process_id, time):
+        self._add_op("X", time)
+
+    def event_send(self, process_id, time, target_id, size, edge_id):
+        self._add_op("M", time, edge_id, size, target_id)
+
+    def add_token(self, place_id, token_pointer, token_value, send_time=None):
+        self._add_op("t", 0, place_id, token_pointer, token_value)
+
+    def remove_token(self, place_id, token_pointer):
+        self._add_op("r", 0, place_id, token_pointer)
+
+    def get_events(self, process_id):
+        if self.index_only:
+            return TraceEvents(
+                process_id,
+                self.kinds.get_array(),
+                self.pointers.get_array(),
+                self.times.get_array(),
+                self.ids.get_array())
+        self.op_starts.append(len(self.op_kinds))
+        return TraceEvents(
+            process_id,
+            self.kinds.get_array(),
+            self.pointers.get_array(),
+            self.times.get_array(),
+            self.ids.get_array(),
+            self.values,
+            self.op_starts.get_array(),
+            self.op_kinds.get_array(),
+            self.op_times.get_array(),
+            self.op_ids.get_array(),
+            self.op_data.get_array(),
+            self.op_values)
+
+
+class TraceEvents:
+    """ Decoded events of one process.
+
+        Events are stored in columns: kinds (a character of the event),
+        pointers (offsets into the original trace), times (without the time
+        offset), ids (id of transition/net/origin process), values (traced
+        values of fired transitions). Operations of the i-th event are
+        stored in the range op_starts[i]:op_starts[i + 1] of op_* columns:
+        op_kinds ('r' remove token, 't' add token, 'M' send, 'Q' quit,
+        'X' end), op_times, op_ids (place/edge id), op_data (token pointer or
+        size of message) and op_values (token values or target process).
+
+        When only the index of events is decoded (op_* columns and values are
+        None), events are processed by the original Trace that parses them
+        from its data.
+    """
+
+    event_names = { "T": "Fire ",
+                    "F": "Fin  ",
+                    "M": "Send ",
+                    "N": "MSend",
+                    "R": "Recv ",
+                    "S": "Spawn",
+                    "I": "Idle ",
+                    "H": "Quit ", # "H" for backward compatability
+                    "Q": "Quit " }
+
+    def __init__(self, process_id, kinds, pointers, times, ids, values=None,
+                 op_starts=None, op_kinds=None, op_times=None, op_ids=None,
+                 op_data=None, op_values=None):
+        self.process_id = process_id
+        self.time_offset = 0
+        self.info = {}
+        self.trace = None
+        self.kinds = kinds
+        self.pointers = pointers
+        self.times = times
+        self.ids = ids
+        self.values = values
+        self.op_starts = op_starts
+        self.op_kinds = op_kinds
+        self.op_times = op_times
+        self.op_ids = op_ids
+        self.op_data = op_data
+        self.op_values = op_values
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def get_init_time(self):
+        s = self.info.get("inittime")
+        if s is not None:
+            return int(s)
+        else:
+            return 0
+
+    def get_event_time(self, index):
+        if index >= len(self.kinds):
+            return None
+        return int(self.times[index]) + self.time_offset
+
+    def get_event_name(self, index):
+        """ Return name of event as 5-character string """
+        return self.event_names.get(self.kinds[index])
+
+    def is_event_visible(self, index):
+        t = self.kinds[index]
+        return t != "I" and t != "M" and t != "N"
+
+    def get_times(self):
+        return self.times + self.time_offset
+
+    def get_visible_mask(self):
+        return (self.kinds != "I") & (self.kinds != "M") & (self.kinds != "N")
+
+    def process_event(self, index, runinstance):
+        if self.op_starts is None:
+            trace = self.trace
+            trace.pointer = int(self.pointers[index])
+            trace.time_offset = self.time_offset
+            trace.process_event(runinstance)
+            return
+
+        process_id = self.process_id
+        offset = self.time_offset
+        t = self.kinds[index]
+        time = int(self.times[index]) + offset
+        runinstance.pre_event()
+        send_time = 0
+        if t == "T":
+            runinstance.transition_fired(process_id,
+                                         time,
+                                         int(self.ids[index]),
+                                         self.values[index])
+        elif t == "F":
+            runinstance.transition_finished(process_id, time)
+        elif t == "R":
+            send_time = runinstance.event_receive(process_id,
+                                                  time,
+                                                  int(self.ids[index]))
+        elif t == "S":
+            runinstance.event_spawn(process_id, time, int(self.ids[index]))
+        elif t == "I":
+            runinstance.event_idle(process_id, time)
+            return
+        elif t == "Q":
+            runinstance.event_quit(process_id, time)
+            return
+
+        for i in xrange(self.op_starts[index], self.op_starts[index + 1]):
+            op = self.op_kinds[i]
+            if op == "t":
+                runinstance.add_token(int(self.op_ids[i]),
+                                      int(self.op_data[i]),
+                                      self.op_values[i],
+                                      send_time)
+            elif op == "r":
+                runinstance.remove_token(int(self.op_ids[i]),
+                                         int(self.op_data[i]))
+            elif op == "M":
+                runinstance.event_send(process_id,
+                                       int(self.op_times[i]) + offset,
+                                       self.op_values[i],
+                                       int(self.op_data[i]),
+                                       int(self.op_ids[i]))
+            elif op == "Q":
+                runinstance.event_quit(process_id,
+                                       int(self.op_times[i]) + offset)
+            elif op == "X":
+                runinstance.event_end(process_id,
+                                      int(self.op_times[i]) + offset)
@@ -0,0 +1,134 @@
+#
+#    Copyright (C) 2014 Stanislav Bohm
+#
+#    This file is part of Kaira.
+#
+#    Kaira is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License, or
+#    (at your option) any later version.
+#
+#    Kaira is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Statistics of a tracelog (the same data as charts in RunView) computed
+# from the exported table without any GUI
+
+import csv
+import json
+import os
+import numpy as np
+from exportri import place_counter_name
+
+PERCENTILES = [ 50, 90, 99 ]
+
+f_eq = lambda x, y: x == y
+f_in = lambda x, y: (x == y[0]) | (x == y[1])
+
+def compute_statistics(tracelog):
+    """ Return a dictionary with statistics of the tracelog; the tracelog
+        has to be loaded with exported data. All times are in
+        nanoseconds. """
+    table = tracelog.data
+    net = tracelog.project.nets[0]
+    processes = tracelog.get_processes()
+    transitions = [ t for t in net.transitions() if t.trace_fire ]
+    places = [ p for p in net.places() if p.trace_tokens ]
+    end_time = tracelog.get_event_time(tracelog.get_runinstances_count() - 1)
+    # Utilization is relative to the time window of a filtered tracelog
+    window = end_time - tracelog.get_start_time()
+
+    return { "end_time" : int(end_time),
+             "process_count" : tracelog.process_count,
+             "processes" : process_statistics(table, processes, window),
+             "transitions" : transition_statistics(table, transitions),
+             "tokens" : tokens_series(table, processes, places) }
+
+def process_statistics(table, processes, window):
+    columns = ["Time", "Duration"]
+    groups = table.group_by(["Event", "Process"],
+                            [("Event", f_in, ('I', 'T'))])
+    result = []
+    for p in processes:
+        tets = groups.get(('T', p), "Duration").filled(0)
+        idles = groups.get(('I', p), "Duration").filled(0)
+        busy = int(tets.sum())
+        result.append({ "process" : p,
+                        "fired" : len(tets),
+                        "busy_time" : busy,
+                        "idle_time" : int(idles.sum()),
+                        "utilization" : busy / float(window)
+                                        if window else 0.0 })
+    return result
+
+def transition_statistics(table, transitions):
+    groups = table.group_by(["ID"], [("Event", f_eq, 'T')])
+    result = []
+    for t in transitions:
+        tets = groups.get(t.id, "Duration").filled(0)
+        stats = { "id" : t.id,
+                  "name" : t.get_name_or_id(),
+                  "fired" : len(tets),
+                  "total_time" : int(tets.sum()) }
+        if len(tets) > 0:
+            stats["min"] = int(tets.min())
+            stats["max"] = int(tets.max())
+            stats["mean"] = float(tets.mean())
+            for q, value in zip(PERCENTILES,
+                                np.percentile(tets, PERCENTILES)):
+                stats["p{0}".format(q)] = float(value)
+        result.append(stats)
+    return result
+
+def tokens_series(table, processes, places):
+    groups = table.group_by(["Process"], [("Event", f_eq, 'C')])
+    result = []
+    for place in places:
+        column = place_counter_name(place)
+        for p in processes:
+            counts = groups.get(p, ["Time", column])
+            result.append({ "place" : place.get_name_or_id(),
+                            "process" : p,
+                            "times" : counts["Time"].filled(0).tolist(),
+                            "counts" : counts[column].filled(0).tolist() })
+    return result
+
+def write_json(stats, filename):
+    with open(filename, "w") as f:
+        json.dump(stats, f, indent=1, sort_keys=True)
+
+def write_csv(stats, directory):
+    """ Write statistics into files 'processes.csv', 'transitions.csv' and
+        'tokens.csv' in the directory. """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    keys = [ "process", "fired", "busy_time", "idle_time", "utilization" ]
+    _write_rows(os.path.join(directory, "processes.csv"),
+                keys, stats["processes"])
+
+    keys = [ "id", "name", "fired", "total_time", "min", "max", "mean" ] + \
+           [ "p{0}".format(q) for q in PERCENTILES ]
+    _write_rows(os.path.join(directory, "transitions.csv"),
+                keys, stats["transitions"])
+
+    with open(os.path.join(directory, "tokens.csv"), "w") as f:
+        writer = csv.writer(f)
+        writer.writerow([ "place", "process", "time", "count" ])
+        for series in stats["tokens"]:
+            for time, count in zip(series["times"], series["counts"]):
+                writer.writerow([ series["place"], series["process"],
+                                  time, count ])
+
+def _write_rows(filename, keys, items):
+    with open(filename, "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(keys)
+        for item in items:
+            writer.writerow([ item.get(key, "") for key in keys ])
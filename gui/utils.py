@@ -18,6 +18,7 @@
 #    along with Kaira.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import heapq
 import math
 import os
 import re
@@ -244,6 +245,49 @@ def index_of_minimal_value(items):
              index = j
     return index
 
+def merge_times(times):
+    """ Merge sequences of times (numpy arrays) into one timeline.
+
+    Return a pair of arrays (sources, indexes); the i-th item of the timeline
+    is the indexes[i]-th item of the sources[i]-th sequence. The result is
+    the same as repeatedly taking the sequence with the minimal next time
+    (the first one in case of a tie), items of each sequence keep their
+    order even if the sequence is not sorted.
+    """
+    if all(np.all(t[1:] >= t[:-1]) for t in times):
+        # All sequences are sorted, a stable sort of all times is enough
+        sources = np.concatenate(
+            [ np.zeros(0, dtype="<i4") ] +
+            [ np.repeat(np.int32(i), len(t)) for i, t in enumerate(times) ])
+        indexes = np.concatenate(
+            [ np.zeros(0, dtype="<i4") ] +
+            [ np.arange(len(t), dtype="<i4") for t in times ])
+        order = np.lexsort((indexes, sources,
+                            np.concatenate([ np.zeros(0, dtype="<i8") ] +
+                                           list(times))))
+        return sources[order], indexes[order]
+
+    # k-way merge
+    lists = [ t.tolist() for t in times ]
+    heap = [ (lst[0], i) for i, lst in enumerate(lists) if lst ]
+    heapq.heapify(heap)
+    positions = [ 0 ] * len(lists)
+    sources = np.zeros(sum(len(lst) for lst in lists), dtype="<i4")
+    indexes = np.zeros(len(sources), dtype="<i4")
+    for index in xrange(len(sources)):
+        time, i = heap[0]
+        lst = lists[i]
+        position = positions[i]
+        sources[index] = i
+        indexes[index] = position
+        position += 1
+        positions[i] = position
+        if position < len(lst):
+            heapq.heapreplace(heap, (lst[position], i))
+        else:
+            heapq.heappop(heap)
+    return sources, indexes
+
 def xml_int(element, attr, default = None):
     if element.get(attr) is None:
         if default is not None:
@@ -423,7 +467,9 @@ ctypes_to_numpy_types_dict = { 'int': '<i4',
 def ctype_to_numpy_type(ctype):
     return ctypes_to_numpy_types_dict[ctype]
 
-def collapse_line_repetitions(items):
+def collapse_line_repetitions(items, limit=None):
+    """ Collapse same consecutive lines. If 'limit' is given, it stops
+        reading of items when more than 'limit' lines are collected. """
     def add(line, count):
         if count == 1:
             result.append(line)
@@ -436,11 +482,16 @@ def collapse_line_repetitions(items):
 
     count = 1
     i = iter(items)
-    last = i.next()
+    try:
+        last = i.next()
+    except StopIteration: # an empty iterator
+        return result
 
     for line in i:
         if line != last:
             add(last, count)
+            if limit is not None and len(result) > limit:
+                return result
             count = 1
             last = line
         else:
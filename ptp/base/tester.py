@@ -18,16 +18,76 @@
 #
 
 import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import hashlib
+import os
 import re
+import time
+from writer import Writer
 
 
 check_id_counter = 30000
 
+# Minimal number of checks in one shard; each shard is a separate translation
+# unit, so it pays the parsing of all included headers
+SHARD_MIN_CHECKS = 32
+
+# Number of precompiled headers kept in the cache
+PCH_LIMIT = 4
+
+# Entries of the cache that were not used for CACHE_MAX_AGE seconds are
+# removed; the cache is cleaned at most once per CACHE_CLEAN_INTERVAL seconds
+CACHE_MAX_AGE = 30 * 24 * 3600
+CACHE_CLEAN_INTERVAL = 24 * 3600
+
+# The compiler of checks
+CXX = "g++"
+
+compiler_versions = {}
+
 def new_id():
     global check_id_counter
     check_id_counter += 1
     return "____cpptest____{0}".format(check_id_counter)
 
+id_pattern = re.compile("____cpptest____\d+")
+
+def hash_strings(strings):
+    h = hashlib.sha1()
+    for string in strings:
+        if isinstance(string, unicode):
+            string = string.encode("utf-8")
+        h.update(string)
+        h.update("\0")
+    return h.hexdigest()
+
+def get_include_directories(args):
+    """ Return directories given by -I options in compiler arguments. """
+    directories = []
+    args = iter(args)
+    for arg in args:
+        if arg == "-I":
+            directories.append(next(args, ""))
+        elif arg.startswith("-I"):
+            directories.append(arg[2:])
+    return directories
+
+def get_compiler_version(compiler):
+    """ Return the output of 'compiler --version'; it is computed only once
+        for each compiler. """
+    version = compiler_versions.get(compiler)
+    if version is None:
+        try:
+            p = subprocess.Popen((compiler, "--version"),
+                                 stderr=subprocess.PIPE,
+                                 stdout=subprocess.PIPE)
+            version = p.communicate()[0]
+        except OSError:
+            version = ""
+        compiler_versions[compiler] = version
+    return version
+
 
 class Check:
 
@@ -64,12 +124,149 @@ class Check:
     def new_id(self):
         return new_id()
 
+    def get_text(self):
+        """ Return the code of the check; generated identifiers are
+            replaced by the same name, so the text does not depend on
+            the order of checks. """
+        writer = Writer()
+        self.write(writer)
+        return id_pattern.sub("____cpptest____", writer.get_string())
+
+
+class CheckCache:
+    """ A persistent set of passed checks. A key of a check is a hash of
+        its text and of the context where it is compiled (see Tester), so
+        any change of the check or of the context creates a new key. Each
+        key is stored as an empty file in 'directory'; its modification
+        time is the time of its last use (see 'clean'). """
+
+    header_extensions = (".h", ".hh", ".hpp")
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_filename(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def contains(self, key):
+        filename = self.get_filename(key)
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            return False
+        if mtime < time.time() - CACHE_CLEAN_INTERVAL:
+            try:
+                os.utime(filename, None) # Used entries are not removed
+            except OSError:
+                pass
+        return True
+
+    def add(self, key):
+        filename = self.get_filename(key)
+        try:
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            open(filename, "w").close()
+        except (IOError, OSError):
+            # The cache is only an optimization
+            pass
+
+    def clean(self):
+        """ Remove entries that were not used for CACHE_MAX_AGE seconds.
+            Nothing is done if the cache was cleaned in the last
+            CACHE_CLEAN_INTERVAL seconds. """
+        stamp = os.path.join(self.directory, "cleaned")
+        now = time.time()
+        try:
+            if os.path.getmtime(stamp) > now - CACHE_CLEAN_INTERVAL:
+                return
+        except OSError:
+            pass # The cache was not cleaned yet
+        try:
+            if not os.path.isdir(self.directory):
+                return
+            open(stamp, "w").close()
+            directories = [ os.path.join(self.directory, name)
+                            for name in os.listdir(self.directory)
+                            if len(name) == 2 ]
+        except (IOError, OSError):
+            return
+        for directory in directories:
+            try:
+                filenames = os.listdir(directory)
+            except OSError:
+                continue
+            for filename in filenames:
+                filename = os.path.join(directory, filename)
+                try:
+                    if os.path.getmtime(filename) < now - CACHE_MAX_AGE:
+                        os.remove(filename)
+                except OSError:
+                    # Another build uses or removes the entry
+                    pass
+
+    def get_pch_filename(self, key):
+        return os.path.join(self.directory, "pch", key + ".gch")
+
+    def use_pch(self, key):
+        """ Return the filename of a cached precompiled header or None. """
+        filename = self.get_pch_filename(key)
+        if not os.path.isfile(filename):
+            return None
+        try:
+            os.utime(filename, None) # Used headers are removed last
+        except OSError:
+            pass
+        return filename
+
+    def add_pch(self, key, filename):
+        """ Move a precompiled header into the cache and remove the least
+            recently used ones over PCH_LIMIT. Returns the new filename. """
+        target = self.get_pch_filename(key)
+        directory = os.path.dirname(target)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            os.rename(filename, target)
+        except OSError:
+            return None
+        try:
+            pchs = [ os.path.join(directory, f) for f in os.listdir(directory)
+                     if f.endswith(".gch") ]
+            pchs.sort(key=os.path.getmtime, reverse=True)
+            for f in pchs[PCH_LIMIT:]:
+                os.remove(f)
+        except OSError:
+            # Another build removes them
+            pass
+        return target
+
+    def get_headers_digest(self, args, ignored=()):
+        """ Return a hash of headers in the include directories of compiler
+            arguments (including their subdirectories); it has to be a part
+            of the context, because checks include these headers. Paths in
+            'ignored' are headers that are never included by checks. """
+        strings = []
+        for directory in get_include_directories(args):
+            for root, dirs, filenames in os.walk(directory):
+                dirs.sort()
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1] \
+                            not in self.header_extensions:
+                        continue
+                    path = os.path.join(root, filename)
+                    if path in ignored:
+                        continue
+                    with open(path, "rb") as f:
+                        strings += [ path, f.read() ]
+        return hash_strings(strings)
+
 
 class Tester:
 
     def __init__(self):
         self.compiler = "gcc"
-        self.filename = "/tmp/kaira.cpp"
+        self.filename = None # Names of shards are derived from it
         self.args = ()
         self.message_parser = re.compile(
             "(?P<filename>[^:]*):(?P<line>\d+):(?P<message>.*)")
@@ -77,37 +274,183 @@ class Tester:
         self.prepare_writer = None
         self.stdout = None
         self.stderr = None
+        self.returncode = None
+        self.cache = None
+        self.context = ()
+        self.jobs = multiprocessing.cpu_count()
+        # A header included by the prepared file that is precompiled before
+        # the first compilation (only with the cache)
+        self.header = None
+        self.pch_ready = False
+        self.pch_stderr = "" # Messages of the precompilation of the header
+
+    def get_context_key(self):
+        """ Return a hash of everything except checks that affects
+            the result: the prepared file, the compiler (with its version)
+            and its arguments and texts given in 'context' (e.g. included
+            headers). """
+        writer = self.prepare_writer(self.filename)
+        return hash_strings([ writer.get_string(),
+                              CXX,
+                              get_compiler_version(CXX) ] +
+                            list(self.args) + list(self.context))
+
+    def get_check_key(self, context_key, check):
+        return hash_strings([ context_key, check.get_text() ])
+
+    def get_filename(self, shard):
+        if shard == 0:
+            return self.filename
+        base, ext = os.path.splitext(self.filename)
+        return "{0}-{1}{2}".format(base, shard, ext)
+
+    def get_object_filename(self, shard):
+        return os.path.splitext(self.get_filename(shard))[0] + ".o"
 
     def add(self, check):
         self.checks.append(check)
 
-    def process_message(self, line):
+    def process_message(self, line, filename, checks):
         match = self.message_parser.match(line)
         if match is None:
             return
-        if match.group("filename") != self.filename:
+        if match.group("filename") != filename:
             return
         line_no = int(match.group("line"))
         message = match.group("message")
-        for check in self.checks:
+        for check in checks:
             if check.process_match(line_no, message):
                 return check
 
     def run(self):
+        """ Compile all checks and return the first failed check or None. """
+        checks = self.run_all()
+        if checks:
+            return checks[0]
+        return None
+
+    def run_all(self):
+        """ Compile all checks and return a list of failed checks (in the
+            order in which they were added). Checks are split into shards
+            that are compiled in parallel (see SHARD_MIN_CHECKS).
+            If there is a cache, checks found in the cache are not compiled
+            and checks of a shard are added into the cache when the shard
+            is compiled without any message. """
         assert self.prepare_writer is not None
-        writer = self.prepare_writer(self.filename)
+        assert self.filename is not None
+        checks = self.checks
+        if self.cache is not None:
+            context_key = self.get_context_key()
+            if checks:
+                keys = [ self.get_check_key(context_key, check)
+                         for check in checks ]
+                pending = [ (check, key) for check, key in zip(checks, keys)
+                            if not self.cache.contains(key) ]
+                checks = [ check for check, key in pending ]
+                keys = [ key for check, key in pending ]
+                done = not checks
+            else:
+                # Only the prepared file is compiled
+                keys = [ context_key ]
+                done = self.cache.contains(context_key)
+            if done:
+                self.stdout, self.stderr, self.returncode = "", "", 0
+                return []
+
+        if self.cache is not None and self.header is not None \
+                and not self.pch_ready:
+            self.precompile_header()
+            self.pch_ready = True
+
+        # Neighbouring checks usually come from the same item, so errors
+        # of an item stay in one shard
+        count = max(min(self.jobs, len(checks) // SHARD_MIN_CHECKS), 1)
+        size = max((len(checks) + count - 1) // count, 1)
+        bounds = [ (start, start + size)
+                   for start in xrange(0, max(len(checks), 1), size) ]
+        shards = [ (i, checks[start:end])
+                   for i, (start, end) in enumerate(bounds) ]
+        if len(shards) == 1:
+            results = [ self._compile(shards[0]) ]
+        else:
+            pool = ThreadPool(len(shards))
+            try:
+                results = pool.map(self._compile, shards)
+            finally:
+                pool.close()
+
+        self.stdout = "".join(r[0] for r in results)
+        self.stderr = self.pch_stderr + "".join(r[1] for r in results)
+        self.returncode = 0
+        failed = set()
+        for (start, end), (stdout, stderr, returncode, f) \
+                in zip(bounds, results):
+            failed.update(f)
+            if returncode != 0:
+                self.returncode = returncode
+            elif self.cache is not None and not stderr \
+                    and not self.pch_stderr:
+                for key in (keys[start:end] if checks else keys):
+                    self.cache.add(key)
+        return [ check for check in self.checks if check in failed ]
 
-        for check in self.checks:
+    def precompile_header(self):
+        """ Put a precompiled header next to the header. It is taken from
+            the cache, or it is created with the same arguments as checks.
+            If the header cannot be precompiled, nothing happens; errors are
+            reported by the following compilation. Warnings of the header
+            are reported with results of checks (following compilations use
+            the precompiled header, so they do not repeat them); such
+            a header and results of checks are not cached. GCC uses
+            the header itself when the precompiled header does not fit. """
+        key = hash_strings([ self.get_context_key(), "pch" ])
+        pch = self.cache.use_pch(key)
+        if pch is None:
+            filename = self.header + ".gch"
+            p = subprocess.Popen((CXX,) + tuple(self.args) +
+                                 ("-O0", "-x", "c++-header",
+                                  "-o", filename, self.header),
+                                 stderr=subprocess.PIPE,
+                                 stdout=subprocess.PIPE)
+            stderr = p.communicate()[1]
+            if p.returncode != 0:
+                if os.path.isfile(filename):
+                    os.remove(filename)
+                return
+            if stderr:
+                self.pch_stderr = stderr
+                return
+            pch = self.cache.add_pch(key, filename)
+            if pch is None:
+                return
+        try:
+            os.symlink(pch, self.header + ".gch")
+        except OSError:
+            pass
+
+    def _compile(self, shard_checks):
+        shard, checks = shard_checks
+        filename = self.get_filename(shard)
+        writer = self.prepare_writer(filename)
+
+        for check in checks:
             check.write(writer)
 
-        writer.write_to_file(self.filename)
-        p = subprocess.Popen(("g++",) + tuple(self.args) +
-                             ("-O0", "-c", "-o", "/tmp/kaira.o", self.filename),
+        writer.write_to_file(filename)
+        p = subprocess.Popen((CXX,) + tuple(self.args) +
+                             ("-O0", "-c",
+                              "-o", self.get_object_filename(shard),
+                              filename),
                              stderr=subprocess.PIPE,
                              stdout=subprocess.PIPE)
-        self.stdout, self.stderr = p.communicate()
-        for line in self.stderr.split("\n"):
-            check = self.process_message(line)
+        stdout, stderr = p.communicate()
+
+        # Only the first message of a check is used
+        remaining = list(checks)
+        failed = []
+        for line in stderr.split("\n"):
+            check = self.process_message(line, filename, remaining)
             if check is not None:
-                return check
-        return None
+                remaining.remove(check)
+                failed.append(check)
+        return stdout, stderr, p.returncode, failed
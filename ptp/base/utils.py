@@ -18,6 +18,8 @@
 #
 
 import re
+import os
+import StringIO
 
 class PtpException(Exception):
 
@@ -172,8 +174,22 @@ class Makefile:
                 out.write("\n")
 
     def write_to_file(self, filename):
-        with open(filename,"w") as f:
-            self.write(f)
+        out = StringIO.StringIO()
+        self.write(out)
+        write_file_if_changed(filename, out.getvalue())
+
+def write_file_if_changed(filename, content):
+    """ Write the content into the file unless the file already contains it.
+        An unchanged file keeps its modification time, so make does not
+        rebuild targets that depend on it. Returns True if the file was
+        written. """
+    if os.path.isfile(filename) and os.path.getsize(filename) == len(content):
+        with open(filename, "r") as f:
+            if f.read() == content:
+                return False
+    with open(filename, "w") as f:
+        f.write(content)
+    return True
 
 def find_first(lst, fn):
     for i in lst:
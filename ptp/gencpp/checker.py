@@ -22,10 +22,18 @@ import base.tester
 import base.utils as utils
 import base.paths as paths
 from base.net import Declarations
-import os.path
+import os
+import shutil
+import tempfile
 import build
 from copy import copy
 
+# A directory of the cache of passed checks; the cache is disabled if the
+# environment variable is set to an empty string
+CACHE_DIRECTORY = os.environ.get(
+    "KAIRA_CHECKER_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "kaira", "checker"))
+
 class CheckStatement(base.tester.Check):
 
     def __init__(self, expression, decls=None, return_type="void", source=None):
@@ -51,8 +59,11 @@ class CheckStatement(base.tester.Check):
     def write_content(self, writer):
         writer.raw_line(self.expression)
 
+    def get_exception(self):
+        return utils.PtpException(self.message, self.source)
+
     def throw_exception(self):
-        raise utils.PtpException(self.message, self.source)
+        raise self.get_exception()
 
 class TypeChecker:
 
@@ -179,26 +190,51 @@ class Checker:
         return builder
 
     def run(self):
+        # Each run has its own directory, so more builds can run at once
+        directory = tempfile.mkdtemp(prefix="kaira-")
+        try:
+            self.run_in_directory(directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run_in_directory(self, directory):
         builder = build.Builder(self.project,
-            os.path.join("/tmp", self.project.get_name() + ".h"))
+            os.path.join(directory, self.project.get_name() + ".h"))
 
         build.write_header_file(builder)
         builder.write_to_file()
 
         tester = base.tester.Tester()
+        tester.filename = os.path.join(directory, "check.cpp")
         tester.prepare_writer = self.prepare_writer
-        tester.args = [ "-I", os.path.join(paths.KAIRA_ROOT, paths.CAILIE_INCLUDE_DIR),
-                        "-I", self.project.root_directory ]
+        include_dirs = [ os.path.join(paths.KAIRA_ROOT, paths.CAILIE_INCLUDE_DIR),
+                         self.project.root_directory ]
+        flags = []
 
         if self.project.get_build_with_octave():
             import ptp # To avoid cyclic import
-            tester.args += [ "-I", os.path.join(paths.KAIRA_ROOT, paths.CAOCTAVE_INCLUDE_DIR) ]
-            tester.args += ptp.get_config("Octave", "INCFLAGS").split()
+            include_dirs.append(os.path.join(paths.KAIRA_ROOT, paths.CAOCTAVE_INCLUDE_DIR))
+            flags += ptp.get_config("Octave", "INCFLAGS").split()
 
         if self.project.build_target == "simrun":
-            tester.args += [ "-I", os.path.join(paths.KAIRA_ROOT, paths.CASIMRUN_INCLUDE_DIR) ]
+            include_dirs.append(os.path.join(paths.KAIRA_ROOT, paths.CASIMRUN_INCLUDE_DIR))
 
+        tester.args = [ arg for d in include_dirs for arg in ("-I", d) ] + flags
         tester.args += self.project.get_build_option("CFLAGS").split()
+
+        if CACHE_DIRECTORY:
+            # Checks depend also on the header of the project and on headers
+            # that can be included by the head code (from all include
+            # directories); the header generated by a build of the project
+            # is not one of them
+            tester.cache = base.tester.CheckCache(CACHE_DIRECTORY)
+            tester.cache.clean()
+            generated = os.path.join(self.project.root_directory,
+                                     self.project.get_name() + ".h")
+            tester.context = [ builder.get_string(),
+                               tester.cache.get_headers_digest(tester.args,
+                                                               [ generated ]) ]
+            tester.header = builder.filename
         tester.run()
 
         if tester.stderr:
@@ -210,6 +246,12 @@ class Checker:
         for check in self.checks:
             tester.add(check)
 
-        check = tester.run()
-        if check is not None:
-            check.throw_exception()
+        # All failed checks are reported, but only one error per source
+        errors = []
+        sources = set()
+        for check in tester.run_all():
+            if check.source is None or check.source not in sources:
+                sources.add(check.source)
+                errors.append(str(check.get_exception()))
+        if errors:
+            raise utils.PtpException("\n".join(errors))
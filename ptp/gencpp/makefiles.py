@@ -94,6 +94,21 @@ def get_other_dependancies(project, directory):
     else:
         return []
 
+def add_precompiled_header_rule(makefile, project):
+    """ Add a rule for the precompiled header of the project (cailie.h and
+        the head code). It is rebuilt when the header, headers of cailie or
+        the makefile (flags) change; when flags of an object differ,
+        the compiler ignores it and uses the header. """
+    name_h = project.get_name() + ".h"
+    name_gch = name_h + ".gch"
+    cailie_headers = "$(wildcard {0})".format(
+        kaira_path(os.path.join(paths.CAILIE_INCLUDE_DIR, "*.h")))
+    makefile.rule(name_gch,
+                  [ name_h, cailie_headers, "makefile" ],
+                  "$(CXX) $(CFLAGS) $(INCLUDE) -x c++-header {0} -o {1}"
+                      .format(name_h, name_gch))
+    return name_gch
+
 def prepare_program_makefile(project, config, directory, other_files=None):
     makefile = prepare_makefile(project, config, directory)
 
@@ -110,12 +125,13 @@ def prepare_program_makefile(project, config, directory, other_files=None):
     makefile.rule(name,
                   deps,
                   "$(CXX) " + " ".join(deps) + " -o $@ $(CFLAGS) $(INCLUDE) $(LIBDIR) $(LIBS) ")
+    name_gch = add_precompiled_header_rule(makefile, project)
     makefile.rule(name_o,
-                  [ name_cpp ],
+                  [ name_cpp, name_gch ],
                   "$(CXX) $(CFLAGS) $(INCLUDE) -c {0} -o {1}".format(name_cpp, name_o))
     makefile.rule("clean",
                   [],
-                  "rm -f {0} {1}".format(name, " ".join(deps + list(other_files))), phony=True)
+                  "rm -f {0} {1}".format(name, " ".join(deps + list(other_files) + [ name_gch ])), phony=True)
     return makefile
 
 
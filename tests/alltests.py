@@ -4,5 +4,6 @@ from tests import *
 from tests_mpi import *
 from tests_octave import *
 from tests_verification import *
+from tests_gui import *
 
 unittest.main()
@@ -6,4 +6,4 @@ if [ -f makefile.main ]; then
 	make -f makefile.main clean
 fi
 
-rm -fr makefile *.xml *.log *.klog *.kreport server *.ktt *.kth
+rm -fr makefile *.xml *.gch *.log *.klog *.kreport server *.ktt *.kth *.kth.idx trace.json trace*.csv trace-npy
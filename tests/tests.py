@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
-from testutils import Project
+from testutils import Project, run_concurrently
 import unittest
+import os
+import shutil
+import tempfile
 
 class BuildTest(unittest.TestCase):
 
@@ -45,6 +48,11 @@ class BuildTest(unittest.TestCase):
                                          processes=10,
                                          params={ "first" : 10, "second" : 7 })
 
+    def test_headcode(self):
+        # Functions defined in the head code are used by code of a place
+        # and of a transition
+        Project("headcode").quick_test("Hello world 12\n")
+
     def test_bidirection(self):
         Project("bidirection").quick_test("11\n12\n13\n")
 
@@ -79,6 +87,41 @@ class BuildTest(unittest.TestCase):
     def test_broken_externtype(self):
         Project("broken_externtype", "broken").fail_ptp("*102/type:", prefix=True)
 
+    def test_concurrent_builds(self):
+        # Checkers of builds running at the same time must not share files
+        hello = Project("helloworld", "helloworlds")
+        projects = [ hello, Project("basictypes"), Project("bulk2"),
+                     Project("doubles") ]
+        broken = Project("broken_externtype", "broken")
+        run_concurrently([ p.build for p in projects ] +
+                         [ lambda: broken.fail_ptp("*102/type:", prefix=True) ])
+        hello.run("Hello world 12\n")
+
+    def test_checker_cache(self):
+        # Passed checks are cached; failed checks and checks of a project
+        # with warnings are not
+        def cached_checks():
+            return sum(len(os.listdir(os.path.join(cache, name)))
+                       for name in os.listdir(cache) if len(name) == 2)
+        cache = tempfile.mkdtemp()
+        os.environ["KAIRA_CHECKER_CACHE"] = cache
+        try:
+            hello = Project("helloworld", "helloworlds")
+            hello.build()
+            count = cached_checks()
+            self.assertTrue(count > 0)
+            hello.quick_test("Hello world 12\n")
+            self.assertEquals(count, cached_checks())
+            for i in xrange(2):
+                Project("broken_externtype", "broken").fail_ptp(
+                    "*102/type:", prefix=True)
+                # Warnings of the head code come from the precompiled header
+                Project("broken_headwarning", "broken").fail_ptp(
+                    "*head:2:2: warning:", prefix=True)
+        finally:
+            del os.environ["KAIRA_CHECKER_CACHE"]
+            shutil.rmtree(cache)
+
     def test_multicast(self):
         Project("multicast").quick_test("1800\n", processes=6)
 
@@ -137,6 +180,11 @@ class BuildTest(unittest.TestCase):
         p = Project("tracelog", trace=True)
         p.quick_test(processes=2, extra_args=["-T100K"])
         p.check_tracelog("14\n")
+        stats = p.tracelog_statistics()
+        self.assertEquals(2, stats["process_count"])
+        self.assertEquals(2, len(stats["processes"]))
+        stats = p.tracelog_statistics(["--tracelog-processes", "1"])
+        self.assertEquals([ 1 ], [ s["process"] for s in stats["processes"] ])
 
     def test_scatter1(self):
         Project("scatter1").quick_test("1941\n", processes=5)
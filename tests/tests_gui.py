@@ -0,0 +1,233 @@
+from testutils import Project, KAIRA_GUI
+import unittest
+import csv
+import os
+import random
+import sys
+import numpy as np
+
+sys.path.append(KAIRA_GUI)
+import paths
+sys.path.append(paths.PTP_DIR)
+import tablewriter
+import tracelog
+from table import Table, ROWS_BLOCK_SIZE
+from runinstance import RunInstance, TokenStore
+
+def runinstance_state(ri):
+    """ Return a comparable summary of the last event and tokens """
+    tokens = [ (process_id, place_id,
+                [ token[1] for token in instance.tokens.get(place_id) ])
+               for process_id, instance in ri.net_instances.items()
+               for place_id in instance.tokens.places
+               if instance.tokens.count(place_id) ]
+    return (ri.last_event, ri.last_event_process, ri.last_event_time,
+            sorted(tokens))
+
+class TableTest(unittest.TestCase):
+
+    columns = [ ("Event", "|S1"), ("Time", "<u8"),
+                ("Duration", "<u8"), ("Process", "<i4") ]
+
+    def create_rows(self):
+        return [ ("T" if i % 3 else "I", i * 10, i if i % 5 else None, i % 4)
+                 for i in xrange(2 * ROWS_BLOCK_SIZE + 7) ]
+
+    def test_add_rows(self):
+        # Buffered rows are visible through all methods of the table
+        rows = self.create_rows()
+        t = Table(self.columns, 10)
+        for i, row in enumerate(rows):
+            t.add_row(row)
+            if i == 100:
+                self.assertEquals(list(row), list(t)[-1])
+        self.assertEquals(len(rows), len(t))
+        self.assertEquals([ list(row) for row in rows ], list(t))
+        self.assertEquals([ row[1] for row in rows ],
+                          t.get_column("Time")[:len(t)].tolist())
+
+        # Rows added as a masked array
+        t2 = Table(self.columns, 10)
+        t2.add_row(rows[0])
+        t2.add_rows(t.data[1:len(t)])
+        self.assertEquals(list(t), list(t2))
+
+    def test_group_by(self):
+        # Groups are the same as results of 'select' for each key
+        t = Table(self.columns, 10)
+        t.add_rows(self.create_rows())
+        t.trim()
+        f_eq = lambda x, y: x == y
+        f_ge = lambda x, y: x >= y
+        groups = t.group_by(["Event", "Process"], [("Time", f_ge, 1000)])
+        self.assertEquals(8, len(groups))
+        for event in ("T", "I", "X"):
+            for process in xrange(5):
+                filters = [ ("Event", f_eq, event),
+                            ("Process", f_eq, process),
+                            ("Time", f_ge, 1000) ]
+                for column in ("Time", "Duration"):
+                    expected = t.select([column], filters)
+                    rows = groups.get((event, process), [column])
+                    self.assertEquals(expected.tolist(), rows.tolist())
+
+
+class RunInstanceTest(unittest.TestCase):
+
+    def test_token_store(self):
+        store = TokenStore()
+        for i in xrange(5):
+            store.add(1, (100 + i % 2, i, None))
+        store.add(2, (200, "a", None))
+        copy = store.copy()
+
+        # Tokens with the same pointer are removed in the order of insertion
+        self.assertEquals(0, store.remove(1, 100)[1])
+        self.assertEquals(2, store.remove(1, 100)[1])
+        self.assertEquals(None, store.remove(1, 102))
+        store.add(3, (300, "b", None))
+        self.assertEquals([ 1, 3, 4 ], [ t[1] for t in store.get(1) ])
+        self.assertEquals(5, store.tokens_count())
+
+        # The copy is not changed; an unchanged place keeps its stamp
+        self.assertEquals(range(5), [ t[1] for t in copy.get(1) ])
+        self.assertEquals(None, copy.get(3))
+        self.assertNotEquals(store.get_stamp(1), copy.get_stamp(1))
+        self.assertEquals(store.get_stamp(2), copy.get_stamp(2))
+
+        # Changes of the copy do not change the store
+        self.assertEquals(1, copy.remove(1, 101)[1])
+        self.assertEquals([ "a" ], [ t[1] for t in copy.remove_all(2) ])
+        self.assertEquals([ 1, 3, 4 ], [ t[1] for t in store.get(1) ])
+        self.assertEquals([ "a" ], [ t[1] for t in store.get(2) ])
+
+    def test_packets_copy(self):
+        ri = RunInstance(None, 3)
+        ri.event_send(0, 10, 1, 8, 5)
+        copy = ri.copy()
+        copy.event_send(0, 20, 1, 8, 5)
+        copy.event_send(2, 30, 1, 8, 6)
+        ri.event_send(1, 40, 0, 8, 7)
+        self.assertEquals(1, ri.get_packets_count(0, 1))
+        self.assertEquals(2, copy.get_packets_count(0, 1))
+        self.assertEquals([ 0 ], ri.get_packet_origins(1))
+        self.assertEquals([ 0, 2 ], copy.get_packet_origins(1))
+        self.assertEquals(0, copy.get_packets_count(1, 0))
+
+
+class TracelogTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        params = { "LIMIT" : "1000", "SIZE" : "20" }
+        p = Project("workers", trace=True)
+        p.quick_test(processes=3, params=params, extra_args=["-T1M"])
+        cls.project = p
+        cls.filename = os.path.join(p.get_directory(), "trace.kth")
+
+    def load(self, **kw):
+        """ Load the tracelog without its index """
+        if os.path.exists(self.filename + ".idx"):
+            os.remove(self.filename + ".idx")
+        return tracelog.TraceLog(self.filename, **kw)
+
+    def replay(self, t):
+        """ Return states after each visible event replayed in order """
+        ri = t.first_runinstance.copy()
+        states = [ runinstance_state(ri) ]
+        for i in xrange(t.get_runinstances_count() - 1):
+            t.execute_visible_events(ri, i, i + 1)
+            states.append(runinstance_state(ri))
+        return states
+
+    def test_decoders(self):
+        # Eager, lazy and parallel decoding give the same events
+        eager = self.load(lazy=False)
+        lazy = self.load(lazy=True)
+        size = tracelog.PARALLEL_LOAD_SIZE
+        tracelog.PARALLEL_LOAD_SIZE = 0
+        try:
+            parallel = self.load(lazy=False)
+        finally:
+            tracelog.PARALLEL_LOAD_SIZE = size
+
+        expected = self.replay(eager)
+        self.assertTrue(len(expected) > 100)
+        for t in (lazy, parallel):
+            for a, b in zip(eager.traces, t.traces):
+                for name in ("kinds", "pointers", "times", "ids"):
+                    self.assertEquals(getattr(a, name).tolist(),
+                                      getattr(b, name).tolist())
+            self.assertEquals(expected, self.replay(t))
+
+    def test_checkpoints(self):
+        # Run instances obtained in a random order through checkpoints are
+        # the same as by a replay in order, also when the memory budget
+        # holds only some checkpoints
+        t = self.load()
+        expected = self.replay(t)
+        count = t.get_runinstances_count()
+        size = t.get_event_runinstance(count - 1).estimate_size()
+        t.checkpoints = tracelog.Checkpoints(t, 7, 3 * size)
+        indexes = range(count) * 2
+        random.Random(0).shuffle(indexes)
+        for i in indexes:
+            self.assertEquals(expected[i],
+                              runinstance_state(t.get_event_runinstance(i)))
+        self.assertTrue(t.checkpoints.size <= 3 * size)
+        self.assertTrue(0 < len(t.checkpoints.checkpoints) < count // 7)
+
+    def test_index(self):
+        # The saved index gives the same tracelog; a corrupted index is
+        # built again
+        expected = self.replay(self.load(export_data=True))
+        index = self.filename + ".idx"
+        self.assertTrue(os.path.isfile(index))
+        with open(index, "rb") as f:
+            data = f.read()
+
+        # Exported data are loaded from the index even if they are not
+        # requested
+        t = tracelog.TraceLog(self.filename)
+        self.assertEquals(expected, self.replay(t))
+        self.assertTrue(len(t.data) > 0)
+        with open(index, "rb") as f:
+            self.assertEquals(data, f.read())
+
+        for corrupted in ("", data[:len(data) // 2], "x" * len(data)):
+            with open(index, "wb") as f:
+                f.write(corrupted)
+            t = tracelog.TraceLog(self.filename, export_data=True)
+            self.assertEquals(expected, self.replay(t))
+            self.assertEquals(len(data), os.path.getsize(index))
+
+    def test_export(self):
+        p = self.project
+        directory = p.get_directory()
+        rows = p.tracelog_export("trace.csv")
+        self.assertEquals(rows, p.tracelog_export("trace-chunks.csv",
+                                                  ["--chunk-size", "10"]))
+        with open(os.path.join(directory, "trace.csv")) as f:
+            csv_rows = list(csv.reader(f))
+        with open(os.path.join(directory, "trace-chunks.csv")) as f:
+            self.assertEquals(csv_rows, list(csv.reader(f)))
+        types, header, csv_rows = csv_rows[0], csv_rows[1], csv_rows[2:]
+        self.assertEquals(rows, len(csv_rows))
+
+        self.assertEquals(rows, p.tracelog_export("trace-npy",
+            ["--tracelog-format", "npy", "--chunk-size", "10"]))
+        columns = tablewriter.load_npy_table(
+            os.path.join(directory, "trace-npy"), "r")
+        self.assertEquals(header, columns.keys())
+        for name, t, values in zip(header, types, zip(*csv_rows)):
+            column = columns[name]
+            self.assertEquals(np.dtype(t), column.dtype)
+            mask = np.array([ value == "" for value in values ])
+            self.assertEquals(mask.tolist(),
+                              np.ma.getmaskarray(column).tolist())
+            values = np.array(values, dtype=object)[~mask]
+            self.assertEquals(values.astype(column.dtype).tolist(),
+                              column.data[~mask].tolist())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@
 import subprocess
 import os
 import time
+import json
+import threading
 
 KAIRA_TESTS = os.path.dirname(os.path.abspath(__file__))
 KAIRA_ROOT = os.path.dirname(KAIRA_TESTS)
@@ -14,6 +16,23 @@ CMDUTILS = os.path.join(KAIRA_GUI, "cmdutils.py")
 
 TEST_PROJECTS = os.path.join(KAIRA_TESTS, "projects")
 
+def run_concurrently(functions):
+    """ Run functions in threads at the same time; the first exception raised
+        by any of them is raised again when all of them finish. """
+    errors = []
+    def run(f):
+        try:
+            f()
+        except Exception, e:
+            errors.append(e)
+    threads = [ threading.Thread(target=run, args=(f,)) for f in functions ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
 class RunProgram:
 
     def __init__(self, filename, parameters=None, cwd=None, env=None):
@@ -198,6 +217,22 @@ class Project:
         args = [ CMDUTILS, "--tracelog", filename ]
         RunProgram("python", args).run(output)
 
+    def tracelog_statistics(self, extra_args=[]):
+        filename = os.path.join(self.get_directory(), "trace.kth")
+        output = os.path.join(self.get_directory(), "trace.json")
+        args = [ CMDUTILS, "--tracelog", filename, "--tracelog-stats", output ]
+        RunProgram("python", args + extra_args).run("")
+        with open(output) as f:
+            return json.load(f)
+
+    def tracelog_export(self, output, extra_args=[]):
+        """ Export the tracelog into 'output' in the project directory;
+            it returns the number of exported rows """
+        filename = os.path.join(self.get_directory(), "trace.kth")
+        output = os.path.join(self.get_directory(), output)
+        args = [ CMDUTILS, "--tracelog", filename, "--tracelog-export", output ]
+        return int(RunProgram("python", args + extra_args).run())
+
     def build_main(self):
         self.build("lib")
         if self.mpi and not self.rpc:
@@ -0,0 +1,83 @@
+# A benchmark of building of the tracelog timeline. It compares the original
+# merging of traces by a linear search of the minimal time with
+# utils.merge_times for a growing number of processes.
+
+import os
+import sys
+import time
+import random
+import argparse
+
+KAIRA_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KAIRA_GUI = os.path.join(KAIRA_ROOT,"gui")
+sys.path.append(KAIRA_GUI)
+
+import numpy as np
+import utils
+
+def generate_times(process_count, events_count):
+    times = []
+    for p in xrange(process_count):
+        t = 0
+        lst = []
+        for i in xrange(events_count):
+            t += random.randint(0, 1000)
+            lst.append(t)
+        times.append(np.array(lst, dtype="<i8"))
+    return times
+
+def linear_merge(times):
+    lists = [ t.tolist() for t in times ]
+    positions = [ 0 ] * len(lists)
+    trace_times = [ lst[0] if lst else None for lst in lists ]
+    sources = []
+    indexes = []
+    while True:
+        i = utils.index_of_minimal_value(trace_times)
+        if i is None:
+            break
+        sources.append(i)
+        indexes.append(positions[i])
+        positions[i] += 1
+        if positions[i] < len(lists[i]):
+            trace_times[i] = lists[i][positions[i]]
+        else:
+            trace_times[i] = None
+    return sources, indexes
+
+def measure(fn, times):
+    start = time.time()
+    result = fn(times)
+    return time.time() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(
+            description='Benchmark of the tracelog timeline construction')
+    parser.add_argument('--processes', metavar="N", type=int, nargs="+",
+                        default=[ 16, 64, 256, 512 ])
+    parser.add_argument('--events', metavar="N", type=int, default=200,
+                        help="Number of events per process")
+    parser.add_argument('--unsorted', action='store_true',
+                        help="Use not sorted times (forces the heap merge)")
+    args = parser.parse_args()
+
+    print "{0:>10} {1:>10} {2:>12} {3:>12} {4:>8}".format(
+        "processes", "events", "linear [s]", "merge [s]", "speedup")
+    for process_count in args.processes:
+        times = generate_times(process_count, args.events)
+        if args.unsorted:
+            for t in times:
+                if len(t) > 1:
+                    t[0], t[1] = t[1] + 1, t[0]
+        linear_time, (sources, indexes) = measure(linear_merge, times)
+        merge_time, (msources, mindexes) = measure(utils.merge_times, times)
+        assert msources.tolist() == sources and mindexes.tolist() == indexes
+        print "{0:>10} {1:>10} {2:>12.3f} {3:>12.3f} {4:>7.1f}x".format(
+            process_count,
+            process_count * args.events,
+            linear_time,
+            merge_time,
+            linear_time / max(merge_time, 1e-9))
+
+if __name__ == "__main__":
+    main()